@@ -0,0 +1,80 @@
+import re
+import threading
+import time
+from typing import Optional
+
+import requests
+import google.auth.transport
+from google.auth.transport import requests as google_requests
+from google.oauth2 import id_token
+
+from caches import TokenMemo
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+
+class CachingRequest(google.auth.transport.Request):
+    """google-auth transport over one persistent HTTP session.
+
+    Successful GET responses (the signing certs) are reused for as long as
+    their Cache-Control max-age allows, so Google's certs are fetched a few
+    times a day instead of on every login.
+    """
+
+    def __init__(self, session: Optional[requests.Session] = None):
+        self._request = google_requests.Request(session=session or requests.Session())
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        if method != "GET" or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, timeout=timeout, **kwargs)
+
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        response = self._request(url, method=method, headers=headers, timeout=timeout, **kwargs)
+        match = _MAX_AGE_RE.search(response.headers.get("Cache-Control", "") or "")
+        if response.status == 200 and match:
+            with self._lock:
+                self._cache[url] = (time.monotonic() + int(match.group(1)), response)
+        return response
+
+
+class GoogleTokenVerifier:
+    """Verifies Google ID tokens, remembering verified tokens briefly.
+
+    A verified token's claims are memoized in a TokenMemo for `memo_ttl`
+    seconds (never past its own exp). `certs_url` can point
+    at a local stand-in for testing.
+    """
+
+    def __init__(self, client_id: str, certs_url: Optional[str] = None, memo_ttl: float = 300,
+                 memo_size: int = 1024, transport: Optional[google.auth.transport.Request] = None):
+        self.client_id = client_id
+        self.certs_url = certs_url or GOOGLE_CERTS_URL
+        self.memo_ttl = memo_ttl
+        self.memo_size = memo_size
+        self.transport = transport or CachingRequest()
+        self._memo = TokenMemo(memo_size)
+
+    def verify(self, token: str) -> dict:
+        """Return the token's claims, raising ValueError when it is not a valid Google ID token"""
+        now = time.time()
+        memoized = self._memo.get(token, now)
+        if memoized is not None:
+            return memoized
+
+        idinfo = id_token.verify_token(token, self.transport, audience=self.client_id, certs_url=self.certs_url)
+        if idinfo.get('iss') not in GOOGLE_ISSUERS:
+            raise ValueError('Wrong issuer.')
+
+        expires_at = min(now + self.memo_ttl, float(idinfo.get('exp', now)))
+        if expires_at > now:
+            self._memo.set(token, idinfo, expires_at)
+        return dict(idinfo)
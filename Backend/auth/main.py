@@ -1,30 +1,52 @@
-from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 from fastapi import *
 from fastapi.responses import JSONResponse, RedirectResponse
 from pymongo import *
+from pymongo.errors import DuplicateKeyError
 import os
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 from fastapi.middleware.cors import CORSMiddleware
-from jwt import JWT, jwk_from_dict
 from typing import Optional
 from bson import ObjectId
 from schema import *
 import gridfs
 from starlette.requests import Request
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from authlib.integrations.starlette_client import OAuth, OAuthError
 from jwt.exceptions import JWTDecodeError
 import httpx
 import redis
-import random
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
+import secrets
 import httpx
 from authlib.integrations.starlette_client import OAuth, OAuthError
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tokens import TokenCodec, session_claims
+from caches import TTLCache
+from indexes import USER_INDEXES, bootstrap
+from database import close_clients, get_database, pool_stats
+from passwords import PasswordHasher
+from ratelimit import LoginThrottle, MemoryRateLimitBackend, RedisRateLimitBackend
+from otp_store import MemoryOTPStore, RedisOTPStore
+from google_verify import GoogleTokenVerifier
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db1, fs
+    # One pooled client per worker, opened here rather than at import
+    db1 = get_database()
+    fs = gridfs.GridFS(db1)
+    # Unique email/google_id indexes back login lookups and the Google upsert
+    app.state.index_report = await run_in_threadpool(bootstrap, db1, {"User": USER_INDEXES})
+    yield
+    password_hasher.shutdown()
+    close_clients()
 
 app = FastAPI(
-    title="Auth service"
+    title="Auth service",
+    lifespan=lifespan
 )
 load_dotenv()
 SERVICE_NAME = "auth_service"
@@ -44,24 +66,42 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-link = os.getenv("Database_Link")
-client1 = MongoClient(link)
-db1 = client1['SSRealEstate']
+# Set by lifespan
+db1 = None
 algorithm = os.getenv("Algorithm")
 access_token_expire_time = int(os.getenv("Access_Token_Expire_Time"))
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated= "auto")
-# BREVO_KEY = os.getenv("Brevo_key")
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+)
+# Password reset codes are emailed through Brevo. Without a key resets are refused, unless
+# OTP_DEV_LOG=1 (local development only) prints the codes to the log instead
+BREVO_KEY = os.getenv("Brevo_key")
+OTP_SENDER_EMAIL = os.getenv("OTP_SENDER_EMAIL")
+OTP_DEV_LOG = os.getenv("OTP_DEV_LOG", "").lower() in ("1", "true", "yes")
 app.add_middleware(SessionMiddleware,
     secret_key = Secret_key,)
 # Add after your existing imports
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
 GOOGLE_CLIENT_SECRET = os.getenv('GOOGLE_CLIENT_SECRET')
 GOOGLE_REDIRECT_URI = os.getenv('GOOGLE_REDIRECT_URI')
-# password = os.getenv('REDIS_PASSWORD')
-# url = os.getenv('url')
-fs = gridfs.GridFS(db1)
-def get_password_hash(password):
-    return pwd_context.hash(password)
+google_verifier = GoogleTokenVerifier(GOOGLE_CLIENT_ID, certs_url=os.getenv("GOOGLE_CERTS_URL"))
+OTP_TTL = int(os.getenv("OTP_TTL", "600"))
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+fs = None
+token_codec = TokenCodec(Secret_key, algorithm)
+login_throttle = LoginThrottle(
+    RedisRateLimitBackend(os.getenv("RATE_LIMIT_REDIS_URL")) if os.getenv("RATE_LIMIT_REDIS_URL") else MemoryRateLimitBackend(),
+    max_failures=int(os.getenv("LOGIN_MAX_FAILURES", "5")),
+    max_ip_failures=int(os.getenv("LOGIN_MAX_IP_FAILURES", "20")),
+    window=float(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes")
+# User records keyed by user id; handlers that change a user pop it so the next lookup reads fresh
+profile_cache = TTLCache(ttl=float(os.getenv("PROFILE_CACHE_TTL", "60")), max_entries=10000)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -69,40 +109,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         if isinstance(value, ObjectId):
             to_encode[key] = str(value)
     
-    jwt_instance = JWT()
-    secret_key = jwk_from_dict({
-        "k": Secret_key,
-        "kty": "oct"
-    })
-    
-    now = datetime.now(timezone.utc)
-    if expires_delta:
-        expire = now + expires_delta
-    else:
-        expire = now + timedelta(hours=1)
-    
-    to_encode.update({
-        "exp": int(expire.timestamp()),
-        "iat": int(now.timestamp())
-    })
-    encoded_jwt = jwt_instance.encode(to_encode, secret_key, alg=algorithm)
-    return encoded_jwt
+    return token_codec.encode(to_encode, expires_delta)
 def decode_Access_token(token: str):
     try:
-        jwt_instance = JWT()
-        secret_key = jwk_from_dict({
-            "k": Secret_key,
-            "kty": "oct"
-        })
-        
-        current_time = datetime.now(timezone.utc)    
-        payload = jwt_instance.decode(token, secret_key, algorithms=[algorithm])
-        
-        exp = payload.get('exp')
-        if exp:
-            exp_time = datetime.fromtimestamp(exp, timezone.utc)
-            if current_time > exp_time:
-                raise HTTPException(status_code=401, detail="Token has expired")
+        # Expiry is checked while decoding
+        payload = token_codec.decode(token)
         
         email: str = payload.get("email")
         role: str = payload.get("role")
@@ -112,10 +123,17 @@ def decode_Access_token(token: str):
             
         token_data = {
             "email": email,
-            "role": role
+            "role": role,
+            "sub": payload.get("sub"),
+            "ver": payload.get("ver", 0)
         }
+        # Refuses sessions revoked by a token_version bump, on every path that decodes a session
+        if get_session_user(token_data) is None:
+            raise HTTPException(status_code=401, detail="User not found")
         return token_data
         
+    except HTTPException as e:
+        raise e
     except JWTDecodeError as e:
         print(f"JWT decode error: {str(e)}")
         if "expired" in str(e).lower():
@@ -139,21 +157,55 @@ def create_cookie(token: str):
     )
     return response
 
+def set_session_cookie(response, token: str):
+    response.set_cookie(
+        key="session",
+        value=token,
+        httponly=True,
+        secure=True,
+        samesite='none',
+        max_age=3600,
+        path="/",
+    )
+    return response
+
+def get_session_user(token_data: dict) -> Optional[dict]:
+    """Load the user behind a decoded session, served from the profile cache when possible"""
+    user_id = token_data.get("sub")
+    user = profile_cache.get(user_id) if user_id else None
+    if user is None:
+        if user_id and ObjectId.is_valid(user_id):
+            query = {"_id": ObjectId(user_id)}
+        else:
+            # Sessions issued before slim tokens only carry the email
+            query = {"email": token_data.get("email")}
+        user = db1.get_collection('User').find_one(query, {"password": 0})
+        if not user:
+            return None
+        profile_cache.set(str(user["_id"]), user)
+    if user.get("token_version", 0) != token_data.get("ver", 0):
+        raise HTTPException(status_code=401, detail="Session has been revoked")
+    return user
+
+def client_ip(request: Request) -> Optional[str]:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for", "").split(",")[0].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else None
+
 def getcookie(token:str):
     response = JSONResponse(content="Admin Login Succesfully")
     response.get_cookie("session")
 
-def verify_password(plain_password, hashed_password):
-    # pwd_context.
-    return pwd_context.verify(plain_password, hashed_password)
-
-# r = redis.Redis(
-#     host='redis-18614.c212.ap-south-1-1.ec2.redns.redis-cloud.com',
-#     port=18614,
-#     decode_responses=True,
-#     username="default",
-#     password=password,
-# )
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
+
+# Codes live in process unless OTP_REDIS_URL points at a shared store for multi node deploys
+if os.getenv("OTP_REDIS_URL"):
+    otp_store = RedisOTPStore(os.getenv("OTP_REDIS_URL"))
+else:
+    otp_store = MemoryOTPStore()
 oauth = OAuth()
 oauth.register(
     name='google',
@@ -168,13 +220,8 @@ oauth.register(
 def verify_google_id_token(token: str) -> Optional[dict]:
     """Verify Google ID token and return user info"""
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token, 
-            google_requests.Request(), 
-            GOOGLE_CLIENT_ID
-        )
-        if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-            raise ValueError('Wrong issuer.')
+        # Checks signature, audience, expiry and issuer with cached certs
+        idinfo = google_verifier.verify(token)
         
         return {
             'google_id': idinfo['sub'],
@@ -188,53 +235,43 @@ def verify_google_id_token(token: str) -> Optional[dict]:
         return None
 
 def get_or_create_google_user(user_info: dict) -> dict:
-    """Get existing Google user or create new one"""
-    existing_user = db1.get_collection('User').find_one({"google_id": user_info['google_id']})
-    
-    if existing_user:
-        db1.get_collection('User').update_one(
-            {"google_id": user_info['google_id']},
-            {"$set": {
-                "name": user_info['name'],
-                "picture": user_info['picture'],
-                "email": user_info['email']
-            }}
-        )
-        existing_user["_id"] = str(existing_user["_id"])
-        return existing_user
-    
-    existing_email_user = db1.get_collection('User').find_one({"email": user_info['email']})
-    
-    if existing_email_user:
-        db1.get_collection('User').update_one(
-            {"email": user_info['email']},
-            {"$set": {
-                "google_id": user_info['google_id'],
-                "name": user_info['name'],
-                "picture": user_info['picture']
-            }}
-        )
-        existing_email_user["_id"] = str(existing_email_user["_id"])
-        return existing_email_user
-    
-    new_user = {
-        "email": user_info['email'],
-        "name": user_info['name'],
-        "google_id": user_info['google_id'],
-        "picture": user_info.get('picture', ''),
-        "role": "user",  # Default role
-        "password": None,  # No password for Google users
-        "email_verified": user_info.get('email_verified', False),
-        "points": 0,
-        "swaps": 0,
-        "items": 0,
-        "favorites": 0,
-        "rating": 0.0
+    """Get existing Google user or create new one in a single atomic upsert.
+
+    Matches on google_id or email so an email/password account gets linked;
+    the unique indexes on both fields keep concurrent first logins from
+    creating duplicates.
+    """
+    update = {
+        "$set": {
+            "google_id": user_info['google_id'],
+            "email": user_info['email'],
+            "name": user_info['name'],
+            "picture": user_info.get('picture', '')
+        },
+        "$setOnInsert": {
+            "role": "user",  # Default role
+            "password": None,  # No password for Google users
+            "email_verified": user_info.get('email_verified', False),
+            "points": 0,
+            "swaps": 0,
+            "items": 0,
+            "favorites": 0,
+            "rating": 0.0
+        }
     }
-    
-    result = db1.get_collection('User').insert_one(new_user)
-    new_user["_id"] = str(result.inserted_id)
-    return new_user
+    query = {"$or": [{"google_id": user_info['google_id']}, {"email": user_info['email']}]}
+    for attempt in range(2):
+        try:
+            user = db1.get_collection('User').find_one_and_update(
+                query, update, upsert=True, return_document=ReturnDocument.AFTER
+            )
+            break
+        except DuplicateKeyError:
+            # A concurrent first login inserted the user, retrying matches it
+            if attempt:
+                raise
+    user["_id"] = str(user["_id"])
+    return user
 
 def serialize_user(user):
     def convert(obj):
@@ -278,15 +315,45 @@ async def check(request: Request):
         return JSONResponse(status_code=200, content={"message": "Authenticated"})
     return JSONResponse(status_code=401, content={"message": "Not Authenticated"})
 
+async def send_otp_email(email: str, otp: int):
+    """Email a password reset code; the code never goes back in an API response"""
+    if not BREVO_KEY:
+        if not OTP_DEV_LOG:
+            raise HTTPException(status_code=503, detail="Password reset email is not configured")
+        print(f"OTP_DEV_LOG set, password reset OTP for {email}: {otp}")  # Debug log
+        return
+    async with httpx.AsyncClient(timeout=10) as client:
+        response = await client.post(
+            "https://api.brevo.com/v3/smtp/email",
+            headers={"api-key": BREVO_KEY},
+            json={
+                "sender": {"email": OTP_SENDER_EMAIL},
+                "to": [{"email": email}],
+                "subject": "Your ReWear password reset code",
+                "textContent": f"Your password reset code is {otp}. It expires in {OTP_TTL // 60} minutes."
+            }
+        )
+    response.raise_for_status()
+
 @app.post("/request-password-reset")
 async def request_password_reset(email: str):
     user = db1.get_collection('User').find_one({"email": email})
     if not user:
         raise HTTPException(status_code=404, detail="Email not found")
-    
-    otp = random.randint(100000, 999999) 
-    result = r.setex(f"otp:{email}", 600, otp)
-    return JSONResponse(status_code=200, content={"otp":otp, "message": "OTP sent successfully"})
+
+    # 6 digits from the OS CSPRNG
+    otp = 100000 + secrets.randbelow(900000)
+    await otp_store.set(f"otp:{email}", otp, OTP_TTL)
+    try:
+        await send_otp_email(email, otp)
+    except HTTPException as e:
+        await otp_store.delete(f"otp:{email}")
+        raise e
+    except Exception as e:
+        await otp_store.delete(f"otp:{email}")
+        print(f"OTP email error: {str(e)}")  # Debug log
+        raise HTTPException(status_code=502, detail="Failed to send OTP")
+    return JSONResponse(status_code=200, content={"message": "OTP sent successfully"})
 
 @app.post("/user")
 async def create_user(user: User):
@@ -295,7 +362,7 @@ async def create_user(user: User):
         if existing_user:
             raise HTTPException(400, detail="Email already registered")
         user_dict = user.model_dump()
-        user_dict["password"] = get_password_hash(user_dict["password"])
+        user_dict["password"] = await get_password_hash(user_dict["password"])
         user_dict["points"] = 0
         user_dict["swaps"] = 0
         user_dict["items"] = 0
@@ -304,7 +371,7 @@ async def create_user(user: User):
         result = db1.get_collection('User').insert_one(user_dict)
         user_dict["_id"] = str(result.inserted_id)        
         expire_timedelta = timedelta(minutes=access_token_expire_time)
-        user_token = create_access_token(user_dict, expire_timedelta)
+        user_token = create_access_token(session_claims(user_dict), expire_timedelta)
         return create_cookie(user_token)
     except HTTPException as he:
         raise he
@@ -314,18 +381,26 @@ async def create_user(user: User):
 @app.put("/user/password-reset")
 async def forgot_password(data: User_forgot_password):
     try:
+        # Only the holder of a reset token from /verifyotp may set a new password, and only once
+        reset_token = await otp_store.get(f"reset:{data.email}")
+        if not reset_token or not secrets.compare_digest(reset_token, data.reset_token):
+            raise HTTPException(status_code=403, detail="Invalid or expired reset token, verify the OTP first")
+        await otp_store.delete(f"reset:{data.email}")
+
         user_record = db1.get_collection('User').find_one({"email": data.email})
         if not user_record:
             raise HTTPException(status_code=404, detail="User not found")
 
-        hashed_password = get_password_hash(data.password)
+        hashed_password = await get_password_hash(data.password)
+        # Bumping the token version revokes existing sessions
         result = db1.get_collection('User').update_one(
             {"email": data.email},
-            {"$set": {"password": hashed_password}}
+            {"$set": {"password": hashed_password}, "$inc": {"token_version": 1}}
         )
 
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        profile_cache.pop(str(user_record["_id"]))
 
         return JSONResponse(status_code=200, content={"message": "Password updated successfully"})
     except HTTPException as he:
@@ -347,19 +422,23 @@ async def change_password(data: User_change_password, request: Request):
         if not user_record:
             raise HTTPException(status_code=404, detail="User not found")
 
-        if not verify_password(data.old_password, user_record.get("password", "")):
+        if not await verify_password(data.old_password, user_record.get("password", "")):
             raise HTTPException(status_code=400, detail="Old password is incorrect")
 
-        new_hashed_password = get_password_hash(data.new_password)
+        new_hashed_password = await get_password_hash(data.new_password)
+        # Bumping the token version revokes other sessions, this one gets a fresh token
         result = db1.get_collection('User').update_one(
             {"email": user_email},
-            {"$set": {"password": new_hashed_password}}
+            {"$set": {"password": new_hashed_password}, "$inc": {"token_version": 1}}
         )
 
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        profile_cache.pop(str(user_record["_id"]))
 
-        return JSONResponse(status_code=200, content={"message": "Password changed successfully"})
+        user_record["token_version"] = user_record.get("token_version", 0) + 1
+        response = JSONResponse(status_code=200, content={"message": "Password changed successfully"})
+        return set_session_cookie(response, create_access_token(session_claims(user_record), timedelta(hours=1)))
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -373,6 +452,7 @@ async def delete_user(user_id: str):
         result = db1.get_collection('User').delete_one({"_id": ObjectId(user_id)})
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        profile_cache.pop(str(user_id))
         
         return JSONResponse(status_code=200, content={"message": "User deleted successfully"})
     except HTTPException as he:
@@ -386,12 +466,16 @@ async def update_user(user_id: str, user: User):
             raise HTTPException(status_code=400, detail="Invalid user ID format")
         
         user_dict = user.model_dump(exclude_unset=True)
+        update = {"$set": user_dict}
         if "password" in user_dict:
-            user_dict["password"] = get_password_hash(user_dict["password"])
+            user_dict["password"] = await get_password_hash(user_dict["password"])
+            # A new password revokes the user's existing sessions
+            update["$inc"] = {"token_version": 1}
         
-        result = db1.get_collection('User').update_one({"_id": ObjectId(user_id)}, {"$set": user_dict})
+        result = db1.get_collection('User').update_one({"_id": ObjectId(user_id)}, update)
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        profile_cache.pop(str(user_id))
         
         updated_user = db1.get_collection('User').find_one({"_id": ObjectId(user_id)})
         return JSONResponse(status_code=200, content=serialize_user(updated_user))
@@ -400,15 +484,22 @@ async def update_user(user_id: str, user: User):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 @app.post("/user/login")
-async def user_login(user: User_login):
+async def user_login(user: User_login, request: Request):
     try:
         print("Login attempt received:", {"email": user.email, "password": "***"})  # Log the incoming request
+        ip = client_ip(request)
+        # Throttled emails and IPs are turned away before any database or bcrypt work
+        await login_throttle.check(user.email, ip)
         user_dict = db1.get_collection('User').find_one({"email": user.email})
         if user_dict:
-            if verify_password(user.password, user_dict.get("password", "")):
+            verified, new_hash = await password_hasher.verify_and_update(user.password, user_dict.get("password", ""))
+            if verified:
+                if new_hash:
+                    # Stored hash used an outdated work factor
+                    db1.get_collection('User').update_one({"_id": user_dict["_id"]}, {"$set": {"password": new_hash}})
                 user_dict["_id"] = str(user_dict["_id"])
                 expire_timedelta = timedelta(hours=1)
-                user_token = create_access_token(user_dict, expire_timedelta)
+                user_token = create_access_token(session_claims(user_dict), expire_timedelta)
                 
                 response = JSONResponse(
                     content={
@@ -416,25 +507,21 @@ async def user_login(user: User_login):
                     "role": user_dict.get("role", "user")
                     }
                 )
-                response.set_cookie(
-                     key="session",
-        value=user_token,
-        httponly=True,
-        secure=True,  
-        samesite='none',
-        max_age=3600,  
-        path="/",  
-        
-                )
+                set_session_cookie(response, user_token)
+                await login_throttle.record_success(user.email)
 
                 print("Login successful for user:", user.email)  # Log successful login
                 return response
             else:
                 print("Invalid password for user:", user.email)  # Log invalid password
+                await login_throttle.record_failure(user.email, ip)
                 raise HTTPException(400, detail="Invalid Password")
         else:
             print("User not found:", user.email)  # Log user not found
+            await login_throttle.record_failure(user.email, ip)
             raise HTTPException(400, detail="User not found")
+    except HTTPException as he:
+        raise he
     except Exception as e:
         print("Login error:", str(e))  # Log any other errors
         raise HTTPException(400, detail=str(e))
@@ -463,10 +550,15 @@ async def get_all_users():
 
 @app.post("/verifyotp")
 async def verify_otp(email: str, otp: int):
-    stored_otp = r.get(f"otp:{email}")
+    stored_otp = await otp_store.get(f"otp:{email}")
     if not stored_otp:
         raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
+    # A code may only be guessed a few times before it is thrown away
+    if await otp_store.incr_attempts(f"otp:{email}") > OTP_MAX_ATTEMPTS:
+        await otp_store.delete(f"otp:{email}")
+        raise HTTPException(status_code=429, detail="Too many attempts, request a new OTP")
+
     try:
         stored_otp_int = int(stored_otp.decode()) if isinstance(stored_otp, bytes) else int(stored_otp)
     except Exception as e:
@@ -475,8 +567,11 @@ async def verify_otp(email: str, otp: int):
     if stored_otp_int != otp:
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    r.delete(f"otp:{email}")
-    return JSONResponse(status_code=200, content={"message": "OTP verified successfully"})
+    await otp_store.delete(f"otp:{email}")
+    # The code is traded for a one time token that /user/password-reset requires
+    reset_token = secrets.token_urlsafe(32)
+    await otp_store.set(f"reset:{email}", reset_token, OTP_TTL)
+    return JSONResponse(status_code=200, content={"message": "OTP verified successfully", "reset_token": reset_token})
 
 @app.put("/user/update")
 async def update_profile(data: UpdateUser, request: Request):
@@ -500,20 +595,26 @@ async def update_profile(data: UpdateUser, request: Request):
             if db1.get_collection('User').find_one({"email": update_fields["email"]}):
                 raise HTTPException(status_code=400, detail="Email already in use")
 
+        update = {"$set": update_fields}
         # Hash password if provided in update
         if "password" in update_fields and update_fields["password"] is not None:
-            update_fields["password"] = get_password_hash(update_fields["password"])
+            update_fields["password"] = await get_password_hash(update_fields["password"])
+            # Bumping the token version revokes other sessions, this one gets a fresh token
+            update["$inc"] = {"token_version": 1}
 
-        result = db1.get_collection('User').update_one(
-            {"email": user_email},
-            {"$set": update_fields}
-        )
+        result = db1.get_collection('User').update_one({"email": user_email}, update)
 
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="User not found")
+        if token_data.get("sub"):
+            profile_cache.pop(str(token_data["sub"]))
 
         updated_user = db1.get_collection('User').find_one({"email": update_fields.get("email", user_email)})
-        return JSONResponse(status_code=200, content={"message": "Profile updated successfully", "user": serialize_user(updated_user)})
+        response = JSONResponse(status_code=200, content={"message": "Profile updated successfully", "user": serialize_user(updated_user)})
+        if "$inc" in update or "email" in update_fields:
+            # The session's claims (version, email) changed
+            set_session_cookie(response, create_access_token(session_claims(updated_user), timedelta(hours=1)))
+        return response
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -531,8 +632,9 @@ async def google_token_login(request: GoogleTokenRequest):
             raise HTTPException(status_code=401, detail="Email not verified")
         
         user = get_or_create_google_user(user_info)
+        profile_cache.pop(str(user["_id"]))
         expire_timedelta = timedelta(hours=1)
-        access_token = create_access_token(user, expire_timedelta)
+        access_token = create_access_token(session_claims(user), expire_timedelta)
         
         response = JSONResponse(
             content={
@@ -540,15 +642,7 @@ async def google_token_login(request: GoogleTokenRequest):
                 "user": serialize_user(user)
             }
         )
-        response.set_cookie(
-            key="session",
-            value=access_token,
-            httponly=True,
-            secure=True,
-            samesite='none',
-            max_age=3600,
-            path="/",
-        )
+        set_session_cookie(response, access_token)
         
         return response
         
@@ -586,22 +680,15 @@ async def google_callback(request: Request):
         }
         
         user = get_or_create_google_user(formatted_user_info)
+        profile_cache.pop(str(user["_id"]))
         
         expire_timedelta = timedelta(hours=1)
-        access_token = create_access_token(user, expire_timedelta)
+        access_token = create_access_token(session_claims(user), expire_timedelta)
         
         frontend_url = os.getenv('FRONTEND_URL')  # Your frontend URL
         response = RedirectResponse(url=f"{frontend_url}/user/dashboard")
         
-        response.set_cookie(
-            key="session",
-            value=access_token,
-            httponly=True,
-            secure=True,
-            samesite='none',
-            max_age=3600,
-            path="/",
-        )
+        set_session_cookie(response, access_token)
         
         return response
         
@@ -629,10 +716,10 @@ async def health_check():
     """
     try:
         db1.command('ping')
-        return {"status": "healthy", "service": SERVICE_NAME}
+        return {"status": "healthy", "service": SERVICE_NAME, "pool": pool_stats()}
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
-        return {"status": "healthy", "service": SERVICE_NAME, "database": "unavailable"}
+        return {"status": "healthy", "service": SERVICE_NAME, "database": "unavailable", "pool": pool_stats()}
 
 @app.get("/user/me")
 async def get_my_profile(request: Request):
@@ -643,9 +730,8 @@ async def get_my_profile(request: Request):
             raise HTTPException(status_code=401, detail="No session token found")
 
         token_data = decode_Access_token(session)
-        user_email = token_data.get("email")
 
-        user_record = db1.get_collection('User').find_one({"email": user_email})
+        user_record = get_session_user(token_data)
         if not user_record:
             raise HTTPException(status_code=404, detail="User not found")
 
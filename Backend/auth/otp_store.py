@@ -0,0 +1,82 @@
+import heapq
+import time
+from typing import Optional
+
+
+class MemoryOTPStore:
+    """Expiring one time codes held in process, for single node deploys.
+
+    Expiry is tracked with a min-heap so purging is cheap, and at most
+    `max_entries` codes are kept; when full the code closest to expiry goes first.
+    """
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._expiry = []
+
+    def _purge(self, now: float):
+        while self._expiry and (self._expiry[0][0] <= now or len(self._entries) > self.max_entries):
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            # Heap items for codes that were replaced since are skipped
+            if entry is not None and entry[0] == expires_at:
+                del self._entries[key]
+
+    def _live(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry
+
+    async def set(self, key: str, value: str, ttl: int):
+        now = time.monotonic()
+        expires_at = now + ttl
+        self._entries[key] = [expires_at, str(value), 0]
+        heapq.heappush(self._expiry, (expires_at, key))
+        self._purge(now)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._live(key)
+        return entry[1] if entry else None
+
+    async def incr_attempts(self, key: str) -> int:
+        entry = self._live(key)
+        if entry is None:
+            return 0
+        entry[2] += 1
+        return entry[2]
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class RedisOTPStore:
+    """Expiring one time codes in a Redis compatible store shared by every node, over a connection pool"""
+
+    def __init__(self, url: str, max_connections: int = 20):
+        import redis.asyncio as aioredis
+        self.pool = aioredis.ConnectionPool.from_url(url, max_connections=max_connections, decode_responses=True)
+        self.redis = aioredis.Redis(connection_pool=self.pool)
+
+    async def set(self, key: str, value: str, ttl: int):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(key, ttl, str(value))
+            pipe.delete(f"{key}:attempts")
+            await pipe.execute()
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.redis.get(key)
+
+    async def incr_attempts(self, key: str) -> int:
+        attempts_key = f"{key}:attempts"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(attempts_key)
+            pipe.ttl(key)
+            attempts, ttl = await pipe.execute()
+        if ttl > 0:
+            await self.redis.expire(attempts_key, ttl)
+        return attempts
+
+    async def delete(self, key: str):
+        await self.redis.delete(key, f"{key}:attempts")
@@ -0,0 +1,57 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+
+class PasswordHasher:
+    """Runs bcrypt off the event loop on a small dedicated thread pool.
+
+    bcrypt releases the GIL while hashing, so threads give real parallelism.
+    At most `max_pending` hash operations may be queued or running; beyond
+    that callers get a 503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4, max_pending: int = 32):
+        # min/max rounds equal to the target make needs_update() flag any hash
+        # made with a different cost, so it is rehashed on the next login
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds,
+        )
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+
+    async def _run(self, func, *args):
+        if self._pending >= self.max_pending:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many password operations in progress, try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: Optional[str]) -> bool:
+        return await self._run(self.context.verify, plain_password, hashed_password)
+
+    async def verify_and_update(self, plain_password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """Verify a password and return a replacement hash when the stored one uses an outdated cost"""
+        return await self._run(self.context.verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {"pending": self._pending, "max_pending": self.max_pending}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
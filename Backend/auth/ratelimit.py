@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Tuple
+from fastapi import HTTPException
+
+
+class MemoryRateLimitBackend:
+    """Sliding windows of failure timestamps and lockouts, held in process.
+
+    Only the `max_keys` most recently used keys are tracked.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lockouts = OrderedDict()
+
+    def _touch(self, store: OrderedDict, key: str, default):
+        value = store.get(key)
+        if value is None:
+            value = default()
+            store[key] = value
+            while len(store) > self.max_keys:
+                store.popitem(last=False)
+        store.move_to_end(key)
+        return value
+
+    async def add_failure(self, key: str, window: float) -> int:
+        """Record a failure and return how many fall inside the window"""
+        now = time.monotonic()
+        failures = self._touch(self._failures, key, deque)
+        failures.append(now)
+        while failures and failures[0] <= now - window:
+            failures.popleft()
+        return len(failures)
+
+    async def clear_failures(self, key: str):
+        self._failures.pop(key, None)
+
+    async def get_lockout(self, key: str) -> Tuple[float, int]:
+        """Return (seconds left, strikes) for a key"""
+        until, strikes = self._lockouts.get(key, (0.0, 0))
+        return max(0.0, until - time.monotonic()), strikes
+
+    async def set_lockout(self, key: str, seconds: float, strikes: int):
+        self._touch(self._lockouts, key, lambda: None)
+        self._lockouts[key] = (time.monotonic() + seconds, strikes)
+
+
+class RedisRateLimitBackend:
+    """The same windows and lockouts in a Redis compatible store shared by every auth worker"""
+
+    def __init__(self, url: str, strike_memory: int = 24 * 3600):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.strike_memory = strike_memory
+
+    async def add_failure(self, key: str, window: float) -> int:
+        now = time.time()
+        name = f"login:failures:{key}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zremrangebyscore(name, 0, now - window)
+            pipe.zadd(name, {f"{now:.6f}": now})
+            pipe.zcard(name)
+            pipe.expire(name, int(window) + 1)
+            results = await pipe.execute()
+        return results[2]
+
+    async def clear_failures(self, key: str):
+        await self.redis.delete(f"login:failures:{key}")
+
+    async def get_lockout(self, key: str) -> Tuple[float, int]:
+        until, strikes = await self.redis.hmget(f"login:lockout:{key}", "until", "strikes")
+        return max(0.0, float(until or 0) - time.time()), int(strikes or 0)
+
+    async def set_lockout(self, key: str, seconds: float, strikes: int):
+        name = f"login:lockout:{key}"
+        await self.redis.hset(name, mapping={"until": time.time() + seconds, "strikes": strikes})
+        await self.redis.expire(name, self.strike_memory)
+
+
+class LoginThrottle:
+    """Rejects login attempts for throttled emails and client IPs before any bcrypt work.
+
+    Each key may fail `max_failures` times (per email) or `max_ip_failures`
+    times (per IP) within `window` seconds. Going over locks the key out for
+    `base_lockout` seconds, doubling on every further lockout up to `max_lockout`.
+    """
+
+    def __init__(self, backend, max_failures: int = 5, max_ip_failures: int = 20, window: float = 300,
+                 base_lockout: float = 30, max_lockout: float = 3600):
+        self.backend = backend
+        self.max_failures = max_failures
+        self.max_ip_failures = max_ip_failures
+        self.window = window
+        self.base_lockout = base_lockout
+        self.max_lockout = max_lockout
+
+    def _keys(self, email: str, ip: Optional[str]):
+        keys = [(f"email:{email.strip().lower()}", self.max_failures)]
+        if ip:
+            keys.append((f"ip:{ip}", self.max_ip_failures))
+        return keys
+
+    async def check(self, email: str, ip: Optional[str]):
+        for key, _ in self._keys(email, ip):
+            remaining, _ = await self.backend.get_lockout(key)
+            if remaining > 0:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many failed login attempts, try again later",
+                    headers={"Retry-After": str(int(remaining) + 1)}
+                )
+
+    async def record_failure(self, email: str, ip: Optional[str]):
+        for key, limit in self._keys(email, ip):
+            failures = await self.backend.add_failure(key, self.window)
+            if failures >= limit:
+                _, strikes = await self.backend.get_lockout(key)
+                seconds = min(self.base_lockout * 2 ** strikes, self.max_lockout)
+                await self.backend.set_lockout(key, seconds, strikes + 1)
+                await self.backend.clear_failures(key)
+
+    async def record_success(self, email: str):
+        # The IP window is left alone so one valid account cannot launder a stuffing run
+        await self.backend.clear_failures(self._keys(email, None)[0][0])
@@ -30,6 +30,7 @@ class admin(BaseModel):
 class User_forgot_password(BaseModel):
     email: str
     password: str
+    reset_token: str
 
 class User_change_password(BaseModel):
     email: str
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The service modules import each other and the shared Backend modules by bare name,
+# as when run from Backend/auth
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+sys.path.append(os.path.dirname(SERVICE_DIR))
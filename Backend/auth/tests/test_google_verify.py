@@ -0,0 +1,201 @@
+"""
+GoogleTokenVerifier and CachingRequest against a local stand-in for Google's
+certs endpoint, with ID tokens signed by a locally generated RSA key.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt, jwt
+
+import google_verify
+from google_verify import CachingRequest, GoogleTokenVerifier
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+KEY_ID = "test-key"
+
+
+def generate_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+
+class Clock:
+    """Stands in for the time module inside google_verify so expiry can be tested without sleeping"""
+
+    def __init__(self):
+        self.offset = 0.0
+
+    def time(self):
+        return time.time() + self.offset
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def advance(self, seconds: float):
+        self.offset += seconds
+
+
+class CertsServer:
+    """Serves {key_id: public key PEM} like https://www.googleapis.com/oauth2/v1/certs"""
+
+    def __init__(self, certs: dict, max_age: int):
+        self.certs = certs
+        self.max_age = max_age
+        self.fetches = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.fetches += 1
+                body = json.dumps(server.certs).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", f"public, max-age={server.max_age}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self._httpd.server_address[1]}/oauth2/v1/certs"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture(scope="module")
+def keys():
+    return generate_key()
+
+
+@pytest.fixture
+def certs_server(keys):
+    server = CertsServer({KEY_ID: keys[1]}, max_age=60)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(google_verify, "time", clock)
+    return clock
+
+
+def make_token(private_pem: str, key_id: str = KEY_ID, lifetime: int = 3600, **claims) -> str:
+    now = int(time.time())
+    payload = {
+        "iss": "https://accounts.google.com",
+        "aud": CLIENT_ID,
+        "sub": "1234567890",
+        "email": "user@example.com",
+        "iat": now,
+        "exp": now + lifetime,
+        **claims
+    }
+    signer = crypt.RSASigner.from_string(private_pem, key_id)
+    return jwt.encode(signer, payload).decode()
+
+
+def test_certs_are_fetched_once_per_max_age(keys, certs_server, clock):
+    # Memoization off, so every verify goes through the transport
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url, memo_size=0)
+    for _ in range(3):
+        assert verifier.verify(make_token(keys[0]))["email"] == "user@example.com"
+    assert certs_server.fetches == 1
+
+    clock.advance(61)
+    verifier.verify(make_token(keys[0]))
+    assert certs_server.fetches == 2
+
+
+def test_caching_request_does_not_reuse_max_age_zero(certs_server, clock):
+    certs_server.max_age = 0
+    transport = CachingRequest()
+    for _ in range(2):
+        assert transport(certs_server.url).status == 200
+    assert certs_server.fetches == 2
+
+
+def test_verified_tokens_are_memoized_for_memo_ttl(keys, certs_server, clock):
+    # Uncached certs make every real verification visible as a fetch
+    certs_server.max_age = 0
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url, memo_ttl=30)
+    token = make_token(keys[0])
+    first = verifier.verify(token)
+    assert verifier.verify(token) == first
+    assert certs_server.fetches == 1
+
+    clock.advance(31)
+    assert verifier.verify(token) == first
+    assert certs_server.fetches == 2
+
+
+def test_memo_never_outlives_token_expiry(keys, certs_server, clock):
+    certs_server.max_age = 0
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url, memo_ttl=300)
+    token = make_token(keys[0], lifetime=20)
+    verifier.verify(token)
+
+    clock.advance(21)
+    verifier.verify(token)
+    assert certs_server.fetches == 2
+
+
+def test_memo_is_bounded(keys, certs_server, clock):
+    certs_server.max_age = 0
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url, memo_size=1)
+    first, second = make_token(keys[0], sub="1"), make_token(keys[0], sub="2")
+    verifier.verify(first)
+    verifier.verify(second)
+    verifier.verify(first)
+    assert certs_server.fetches == 3
+
+
+@pytest.mark.parametrize("issuer", ["accounts.google.com", "https://accounts.google.com"])
+def test_google_issuers_are_accepted(keys, certs_server, issuer):
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url)
+    assert verifier.verify(make_token(keys[0], iss=issuer))["iss"] == issuer
+
+
+def test_wrong_issuer_is_rejected_and_not_memoized(keys, certs_server):
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url)
+    token = make_token(keys[0], iss="https://evil.example.com")
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Wrong issuer"):
+            verifier.verify(token)
+
+
+def test_wrong_audience_is_rejected(keys, certs_server):
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url)
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(keys[0], aud="someone-else.apps.googleusercontent.com"))
+
+
+def test_token_signed_with_another_key_is_rejected(certs_server):
+    other_private, _ = generate_key()
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url)
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(other_private))
+
+
+def test_expired_token_is_rejected(keys, certs_server):
+    verifier = GoogleTokenVerifier(CLIENT_ID, certs_url=certs_server.url)
+    with pytest.raises(ValueError):
+        verifier.verify(make_token(keys[0], iat=int(time.time()) - 7200, lifetime=-3600))
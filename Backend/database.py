@@ -1,15 +1,187 @@
-from pymongo import MongoClient
-from urllib.parse import quote_plus
+"""
+Shared MongoDB connection for the services.
+
+Each process gets at most one pooled client (plus one Motor client for the
+async services), created lazily on first use, normally from the FastAPI
+lifespan, and closed by close_clients() on shutdown. Nothing connects at
+import time. Pool size, timeouts and read preference come from the
+environment:
+
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SOCKET_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_READ_PREFERENCE
+"""
 import os
+import threading
+from typing import Optional
 from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.database import Database
+from pymongo.monitoring import ConnectionPoolListener
+
 load_dotenv()
 
-mongo_uri = os.getenv("Database_link")
+DATABASE_NAME = os.getenv("Database_Name", "SSRealEstate")
+
+# MongoClient keyword -> (environment variable, default); None leaves the driver default
+_POOL_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 300000),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", None),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+}
+
+
+def client_options() -> dict:
+    """MongoClient keyword arguments built from the environment"""
+    options = {}
+    for option, (variable, default) in _POOL_OPTIONS.items():
+        value = os.getenv(variable)
+        if value:
+            options[option] = int(value)
+        elif default is not None:
+            options[option] = default
+    options["readPreference"] = os.getenv("MONGO_READ_PREFERENCE", "primary")
+    return options
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Counts connection pool events across every server the client talks to"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.open = 0
+            self.checked_out = 0
+            self.waiting = 0
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.max_checked_out = 0
+            self.max_waiting = 0
+            self.checkout_wait_total = 0.0
+            self.pool_clears = 0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open = max(0, self.open - 1)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.waiting = max(0, self.waiting - 1)
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkout_wait_total += getattr(event, "duration", 0.0) or 0.0
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(0, self.checked_out - 1)
+
+    def snapshot(self, max_pool_size: int) -> dict:
+        with self._lock:
+            return {
+                "max_pool_size": max_pool_size,
+                "open": self.open,
+                "checked_out": self.checked_out,
+                "waiting": self.waiting,
+                "utilization": round(self.checked_out / max_pool_size, 3) if max_pool_size else None,
+                "max_checked_out": self.max_checked_out,
+                "max_waiting": self.max_waiting,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "avg_checkout_wait_ms": round(self.checkout_wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "pool_clears": self.pool_clears,
+            }
+
+
+pool_metrics = PoolMetrics()
+_lock = threading.Lock()
+_client: Optional[MongoClient] = None
+_async_client = None
+
+
+def get_client() -> MongoClient:
+    """Return this process's pooled MongoClient, creating it on first use"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(os.getenv("Database_Link"), event_listeners=[pool_metrics], **client_options())
+    return _client
+
+
+def get_async_client():
+    """Return this process's pooled Motor client, creating it on first use"""
+    global _async_client
+    if _async_client is None:
+        # Only the async services install motor
+        from motor.motor_asyncio import AsyncIOMotorClient
+        with _lock:
+            if _async_client is None:
+                _async_client = AsyncIOMotorClient(
+                    os.getenv("Database_Link"), event_listeners=[pool_metrics], **client_options()
+                )
+    return _async_client
+
+
+def get_database(name: str = DATABASE_NAME) -> Database:
+    return get_client()[name]
+
+
+def get_async_database(name: str = DATABASE_NAME):
+    return get_async_client()[name]
+
+
+def pool_stats() -> dict:
+    """Pool utilization for the clients this process has opened"""
+    return pool_metrics.snapshot(client_options()["maxPoolSize"])
+
 
-client1 = MongoClient(mongo_uri)
-db1 = client1['SSRealEstate']
-collection = db1.create_collection("User")
-collection2= db1.create_collection("Product")
-collection4 = db1.create_collection("Transaction")
-collection6 = db1.create_collection("Wishlist")
-print("Connection Succesfull")
+def close_clients():
+    """Close the clients opened by this process; the next get_* call opens new ones"""
+    global _client, _async_client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
+    pool_metrics.reset()
@@ -0,0 +1,129 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from starlette.concurrency import run_in_threadpool
+
+# Fields of an ImageResponse kept for each stored image
+ENTRY_FIELDS = ("url", "public_id", "size", "format", "variants", "variant_ids")
+
+
+def content_key(contents: bytes, profile: str) -> str:
+    """SHA-256 of an image's bytes and of the processing profile that shaped its stored variants"""
+    digest = hashlib.sha256(profile.encode())
+    digest.update(b"\0")
+    digest.update(contents)
+    return digest.hexdigest()
+
+
+class ImageIndex:
+    """Maps content hashes of uploaded images to where they are already stored.
+
+    Entries live in the ImageHash collection with an LRU of `cache_size`
+    entries in front. Each entry counts the uploads that resolved to it in
+    `refs`, so deleting one listing's copy does not destroy the stored image
+    another listing still uses.
+    """
+
+    def __init__(self, collection: Collection, cache_size: int = 4096):
+        self.collection = collection
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _remember(self, key: str, entry: dict):
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _forget(self, public_id: str):
+        with self._lock:
+            for key in [k for k, entry in self._cache.items() if entry["public_id"] == public_id]:
+                del self._cache[key]
+
+    async def lookup(self, key: str, refs: int = 1) -> Optional[dict]:
+        """Return the stored image for a content key and count `refs` more uses of it"""
+        entry = self._cached(key)
+        if entry is not None:
+            # The cache only saves the projection; the count is always bumped in the database,
+            # and an entry another worker has released since is a miss
+            result = await run_in_threadpool(self.collection.update_one, {"_id": key}, {"$inc": {"refs": refs}})
+            if result.matched_count:
+                return entry
+            with self._lock:
+                self._cache.pop(key, None)
+            return None
+        doc = await run_in_threadpool(
+            self.collection.find_one_and_update,
+            {"_id": key},
+            {"$inc": {"refs": refs}},
+            projection={field: 1 for field in ENTRY_FIELDS},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        entry = {field: doc.get(field) for field in ENTRY_FIELDS}
+        self._remember(key, entry)
+        return entry
+
+    async def lookup_similar(self, phash: str, refs: int = 1) -> Optional[dict]:
+        """Return a stored image with the same perceptual hash, if any"""
+        doc = await run_in_threadpool(
+            self.collection.find_one_and_update,
+            {"phash": phash},
+            {"$inc": {"refs": refs}},
+            projection={field: 1 for field in ENTRY_FIELDS},
+            return_document=ReturnDocument.AFTER
+        )
+        return {field: doc.get(field) for field in ENTRY_FIELDS} if doc else None
+
+    async def add(self, key: str, entry: dict, refs: int = 1, phash: Optional[str] = None):
+        doc = {field: entry[field] for field in ENTRY_FIELDS}
+        doc["created_at"] = datetime.now(timezone.utc)
+        if phash:
+            doc["phash"] = phash
+        await run_in_threadpool(
+            self.collection.update_one,
+            {"_id": key},
+            {"$setOnInsert": doc, "$inc": {"refs": refs}},
+            upsert=True
+        )
+        self._remember(key, {field: doc[field] for field in ENTRY_FIELDS})
+
+    async def release(self, public_id: str) -> Optional[dict]:
+        """Drop one use of a stored image, or return None if it is not indexed.
+
+        Returns the uses left in `refs` and, for the caller to delete with the
+        image once none are left, the public_ids of its variants in `variant_ids`.
+        """
+        doc = await run_in_threadpool(
+            self.collection.find_one_and_update,
+            {"public_id": public_id},
+            {"$inc": {"refs": -1}},
+            projection={"refs": 1, "variant_ids": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is None:
+            return None
+        released = {"refs": doc["refs"], "variant_ids": doc.get("variant_ids") or {}}
+        if doc["refs"] > 0:
+            return released
+        self._forget(public_id)
+        # Only entries still unused are deleted; a lookup may have re-used it since the decrement
+        deleted = await run_in_threadpool(self.collection.delete_many, {"public_id": public_id, "refs": {"$lte": 0}})
+        if not deleted.deleted_count:
+            released["refs"] = 1
+        return released
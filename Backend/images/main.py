@@ -1,8 +1,13 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse
+from functools import lru_cache
+import hashlib
+import json
 from fastapi.middleware.cors import CORSMiddleware
-import cloudinary
-import cloudinary.uploader
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
@@ -11,19 +16,58 @@ import sys
 import os
 import httpx
 from PIL import Image
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 import io
+from storage import CloudinaryBackend, LocalDiskBackend, StubBackend
+from uploads import UploadPool
+from processing import ImageProcessor, perceptual_hash
+from dedup import ImageIndex, content_key
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from indexes import IMAGE_HASH_INDEXES, JOB_INDEXES, bootstrap
+from jobs import JobQueue, MongoJobStore
+from database import close_clients, get_database
 # from app.auth import get_current_user, require_role
 # from app.middleware import setup_middleware
 
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global image_index
+    app.state.image_index = None
+    if IMAGE_DEDUP or JOB_QUEUE_DURABLE:
+        try:
+            db = get_database()
+            app.state.index_report = await run_in_threadpool(bootstrap, db, {
+                **({"ImageHash": IMAGE_HASH_INDEXES} if IMAGE_DEDUP else {}),
+                **({"ImageJob": JOB_INDEXES} if JOB_QUEUE_DURABLE else {})
+            })
+            if IMAGE_DEDUP:
+                image_index = ImageIndex(db.get_collection("ImageHash"), cache_size=int(os.getenv("IMAGE_DEDUP_CACHE_SIZE", "4096")))
+                app.state.image_index = image_index
+            if JOB_QUEUE_DURABLE:
+                job_queue.store = MongoJobStore(db.get_collection("ImageJob"))
+        except Exception as e:
+            # Dedup and the durable queue are optional; uploads go ahead without them
+            print(f"Image database setup failed, running without dedup and durable jobs: {str(e)}")
+            image_index = None
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    upload_pool.shutdown()
+    if image_processor is not None:
+        image_processor.shutdown()
+    close_clients()
+
 app = FastAPI(
     title="Image Service",
     description="Microservice for handling image uploads and transformations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
+SERVICE_NAME = "image_service"
 
 # setup_middleware(app)
 origins = [
@@ -42,11 +86,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 Secret_key = os.getenv("SECRET_KEY")
-cloudinary.config(
-    cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.getenv('CLOUDINARY_API_KEY'),
-    api_secret=os.getenv('CLOUDINARY_API_SECRET')
+# IMAGE_STORAGE_BACKEND: cloudinary (default), local (files on disk served by /files) or
+# stub (in memory, for benchmarks)
+IMAGE_STORAGE_BACKEND = os.getenv("IMAGE_STORAGE_BACKEND", "cloudinary")
+if IMAGE_STORAGE_BACKEND == "stub":
+    storage_backend = StubBackend(latency=float(os.getenv("STUB_UPLOAD_LATENCY", "0")))
+elif IMAGE_STORAGE_BACKEND == "local":
+    storage_backend = LocalDiskBackend(
+        root=os.getenv("LOCAL_STORAGE_ROOT", "image-store"),
+        base_url=os.getenv("LOCAL_STORAGE_BASE_URL", f"http://localhost:{os.getenv('PORT', '8003')}")
+    )
+else:
+    storage_backend = CloudinaryBackend(
+        cloud_name=os.getenv('CLOUDINARY_CLOUD_NAME'),
+        api_key=os.getenv('CLOUDINARY_API_KEY'),
+        api_secret=os.getenv('CLOUDINARY_API_SECRET'),
+        sign_urls=os.getenv("CLOUDINARY_SIGN_URLS", "").lower() in ("1", "true", "yes")
+    )
+TRANSFORM_CACHE_MAX_AGE = int(os.getenv("TRANSFORM_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+# Sizes the frontend asks for on every listing card, e.g. "300x200,640x480"
+TRANSFORM_PRESETS = [
+    tuple(int(n) for n in preset.split("x")) for preset in os.getenv("TRANSFORM_PRESETS", "300x200").split(",") if preset
+]
+
+@lru_cache(maxsize=int(os.getenv("TRANSFORM_URL_CACHE_SIZE", "16384")))
+def transformed_url(public_id: str, width: int, height: int, crop: str, format: Optional[str]) -> str:
+    """Memoized transform URL; building (and signing) one is pure string work"""
+    return storage_backend.build_url(public_id, width, height, crop, format)
+upload_pool = UploadPool(
+    storage_backend,
+    max_workers=int(os.getenv("UPLOAD_WORKERS", "6")),
+    timeout=float(os.getenv("UPLOAD_TIMEOUT", "30"))
 )
+# IMAGE_PROCESSING=1 resizes, strips metadata and re-encodes uploads, adding thumbnail variants
+image_processor = None
+if os.getenv("IMAGE_PROCESSING", "").lower() in ("1", "true", "yes"):
+    image_processor = ImageProcessor(
+        max_edge=int(os.getenv("IMAGE_MAX_EDGE", "2048")),
+        thumbnail_edges=tuple(int(edge) for edge in os.getenv("IMAGE_THUMBNAIL_EDGES", "320,640").split(",") if edge),
+        quality=int(os.getenv("IMAGE_QUALITY", "80")),
+        format=os.getenv("IMAGE_OUTPUT_FORMAT", "webp"),
+        max_workers=int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+    )
+processing_profile = image_processor.profile() if image_processor is not None else "original"
+# IMAGE_DEDUP=1 resolves re-uploads of an image already stored to the stored copy (needs Database_Link)
+IMAGE_DEDUP = os.getenv("IMAGE_DEDUP", "").lower() in ("1", "true", "yes")
+# Also treat near identical images (same perceptual hash) as duplicates
+IMAGE_DEDUP_PERCEPTUAL = os.getenv("IMAGE_DEDUP_PERCEPTUAL", "").lower() in ("1", "true", "yes")
+# Set by lifespan when IMAGE_DEDUP is on and the database is reachable
+image_index = None
+# Cleanup of stored objects runs here, off the request path;
+# JOB_QUEUE_DURABLE=1 keeps queued jobs in the ImageJob collection across restarts
+JOB_QUEUE_DURABLE = os.getenv("JOB_QUEUE_DURABLE", "").lower() in ("1", "true", "yes")
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+)
+
+@job_queue.job("delete_objects")
+async def delete_objects(public_ids: List[str]):
+    for public_id in public_ids:
+        await run_in_threadpool(storage_backend.delete, public_id)
 # url = os.getenv('url')
 app.add_middleware(SessionMiddleware, secret_key=Secret_key)
 
@@ -56,35 +156,94 @@ class ImageResponse(BaseModel):
     created_at: datetime
     size: int = Field(..., description="Size of the image in bytes")
     format: str = Field(..., description="Image format (e.g., jpeg, png)")
+    variants: Dict[str, str] = Field(default_factory=dict, description="URL of each stored variant, e.g. full, w320")
 
 class TransformResponse(BaseModel):
     url: str
+    public_id: Optional[str] = None
     width: int
     height: int
     format: str = Field(..., description="Image format (e.g., jpeg, png)")
 
+class TransformRequest(BaseModel):
+    public_id: str
+    width: int = Field(300, ge=1, le=2000)
+    height: int = Field(200, ge=1, le=2000)
+    crop: str = Field("fill", pattern="^(fill|crop|scale|thumb)$")
+    format: Optional[str] = Field(None, pattern="^(jpeg|png|gif|webp)$")
+
+class TransformBatchRequest(BaseModel):
+    items: List[TransformRequest] = Field(..., min_length=1, max_length=200)
+
 # Constants
 ALLOWED_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp'}
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+# Width x height limit, checked from the header before anything is decoded
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(40 * 1000 * 1000)))
+READ_CHUNK_SIZE = 64 * 1024
+# Leading bytes of each accepted format
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+)
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Return the image format named by a file's first bytes"""
+    for signature, format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+async def validate_image(file: UploadFile) -> tuple[bytes, str, int]:
+    """Validate image file and return its contents, format, and size.
 
-def validate_image(file: UploadFile) -> tuple[bytes, str, int]:
-    """Validate image file and return its contents, format, and size"""
+    The upload is read in chunks and rejected as soon as it passes
+    MAX_IMAGE_SIZE or its first bytes are not an accepted format. Dimensions
+    are then read from the header only, so oversized images are refused
+    before any pixel data is decoded.
+    """
     if file.content_type not in ALLOWED_IMAGE_TYPES:
         raise HTTPException(400, f"Unsupported image type. Allowed types: {', '.join(ALLOWED_IMAGE_TYPES)}")
-    
-    contents = file.file.read()
-    if len(contents) > MAX_IMAGE_SIZE:
-        raise HTTPException(400, f"Image size exceeds maximum allowed size of {MAX_IMAGE_SIZE/1024/1024}MB")
-    
+    too_large = f"Image size exceeds maximum allowed size of {MAX_IMAGE_SIZE/1024/1024}MB"
+    if file.size is not None and file.size > MAX_IMAGE_SIZE:
+        raise HTTPException(400, too_large)
+
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        if not chunks and sniff_format(chunk) is None:
+            raise HTTPException(400, "Invalid image format")
+        size += len(chunk)
+        if size > MAX_IMAGE_SIZE:
+            raise HTTPException(400, too_large)
+        chunks.append(chunk)
+    if not chunks:
+        raise HTTPException(400, "Invalid image file: empty upload")
+    # One copy to join the chunks; the bytes object is then shared, not copied, by PIL and the backend
+    contents = chunks[0] if len(chunks) == 1 else b"".join(chunks)
+    del chunks
+
     try:
+        # Image.open only parses the header; nothing is decoded here
         image = Image.open(io.BytesIO(contents))
         format = image.format.lower()
-        if format not in ['jpeg', 'png', 'gif', 'webp']:
-            raise HTTPException(400, "Invalid image format")
+        width, height = image.size
     except Exception as e:
         raise HTTPException(400, f"Invalid image file: {str(e)}")
-    
-    return contents, format, len(contents)
+    if format != sniff_format(contents):
+        raise HTTPException(400, "Invalid image format")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise HTTPException(400, f"Image dimensions {width}x{height} exceed the maximum of {MAX_IMAGE_PIXELS} pixels")
+
+    return contents, format, size
 
 # Routes
 @app.post("/upload", response_model=List[ImageResponse])
@@ -93,32 +252,144 @@ async def upload_image(
     folder: str = "product",
     # current_user: dict = Depends(get_current_user)
 ):
+    """
+    Upload images concurrently, returning them in the order they were sent.
+    If any upload fails the response is a 502 listing what was uploaded and what failed.
+    """
     try:
-        responses=[]
-        for i in file:
-            contents, format, size = validate_image(i)
-            result = cloudinary.uploader.upload(
-                io.BytesIO(contents),
-                folder=folder,
-                resource_type="auto",
-                format=format
-            )
-            responses.append(ImageResponse(
-            url=result['secure_url'],
-            public_id=result['public_id'],
-            created_at=datetime.now(),
-            size=size,
-            format=format
-        ))
+        # Every file is validated before anything is uploaded
+        validated = [await validate_image(i) for i in file]
+        if image_index is not None:
+            keys = [content_key(contents, processing_profile) for contents, _, _ in validated]
+        else:
+            keys = [str(index) for index in range(len(validated))]
+        # Repeats of one image within the request are stored once
+        first_seen = {}
+        for index, key in enumerate(keys):
+            first_seen.setdefault(key, index)
+        counts = {key: keys.count(key) for key in first_seen}
+
+        stored = {}
+        phashes = {}
+        if image_index is not None:
+            try:
+                hits = await asyncio.gather(*(image_index.lookup(key, counts[key]) for key in first_seen))
+                stored = {key: entry for key, entry in zip(first_seen, hits) if entry is not None}
+                if IMAGE_DEDUP_PERCEPTUAL:
+                    for key in [key for key in first_seen if key not in stored]:
+                        contents = validated[first_seen[key]][0]
+                        phashes[key] = await (image_processor.perceptual_hash(contents) if image_processor is not None
+                                              else run_in_threadpool(perceptual_hash, contents))
+                        similar = await image_index.lookup_similar(phashes[key], counts[key])
+                        if similar is not None:
+                            stored[key] = similar
+            except Exception as e:
+                # Dedup is an optimization; uploads go ahead without it
+                print(f"Image dedup lookup failed: {str(e)}")
+        new_keys = [key for key in first_seen if key not in stored]
+
+        if image_processor is not None:
+            processed = await asyncio.gather(*(image_processor.process(validated[first_seen[key]][0]) for key in new_keys))
+        else:
+            processed = [[("full", validated[first_seen[key]][0], validated[first_seen[key]][1], None, None)] for key in new_keys]
+        # Every variant of every new image goes through the pool at once
+        results = await upload_pool.upload_many(
+            [(contents, format) for variants in processed for _, contents, format, _, _ in variants], folder
+        )
+
+        errors = {}
+        orphans = []
+        offset = 0
+        for key, variants in zip(new_keys, processed):
+            uploaded = results[offset:offset + len(variants)]
+            offset += len(variants)
+            failures = [r for r in uploaded if isinstance(r, BaseException)]
+            if failures:
+                errors[key] = str(failures[0]) or type(failures[0]).__name__
+                orphans.extend(r['public_id'] for r in uploaded if not isinstance(r, BaseException))
+                continue
+            _, contents, format, _, _ = variants[0]
+            stored[key] = {
+                "url": uploaded[0]['url'],
+                "public_id": uploaded[0]['public_id'],
+                "size": len(contents),
+                "format": format,
+                "variants": {name: result['url'] for (name, _, _, _, _), result in zip(variants, uploaded)},
+                "variant_ids": {name: result['public_id'] for (name, _, _, _, _), result in zip(variants, uploaded)
+                                if name != "full"}
+            }
+            if image_index is not None:
+                try:
+                    await image_index.add(key, stored[key], counts[key], phashes.get(key))
+                except Exception as e:
+                    print(f"Image dedup index update failed: {str(e)}")
+
+        responses = []
+        failed = []
+        for index, (upload, key) in enumerate(zip(file, keys)):
+            if key in errors:
+                print(f"Upload of {upload.filename} failed: {errors[key]}")
+                failed.append({"index": index, "filename": upload.filename, "error": errors[key]})
+                continue
+            responses.append(ImageResponse(created_at=datetime.now(), **stored[key]))
+        if failed:
+            # Variants of a failed file are useless on their own
+            if orphans:
+                await job_queue.enqueue("delete_objects", public_ids=orphans)
+            raise HTTPException(502, {
+                "message": f"{len(failed)} of {len(file)} images failed to upload",
+                "uploaded": [r.model_dump(mode="json") for r in responses],
+                "failed": failed
+            })
+        # Precompute the card sizes so the first gallery view is served from the URL cache
+        for response in responses:
+            for width, height in TRANSFORM_PRESETS:
+                transformed_url(response.public_id, width, height, "fill", None)
         return responses
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(500, f"Failed to upload image: {str(e)}")
 
-@app.get("/transform/{public_id}", response_model=TransformResponse)
+def transform_headers(body: str) -> dict:
+    # Transform URLs are a pure function of their inputs, so they can be cached for long
+    return {
+        "ETag": '"' + hashlib.sha256(body.encode()).hexdigest()[:32] + '"',
+        "Cache-Control": f"public, max-age={TRANSFORM_CACHE_MAX_AGE}, immutable"
+    }
+
+def cached_transform_response(request: Request, payload) -> Response:
+    body = json.dumps(jsonable_encoder(payload), separators=(",", ":"))
+    headers = transform_headers(body)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@app.post("/transform/batch", response_model=List[TransformResponse])
+async def transform_images(data: TransformBatchRequest, request: Request):
+    """
+    Transform many images in one request, e.g. every thumbnail on a gallery page.
+    Results come back in the order of the requested items.
+    """
+    try:
+        responses = [
+            TransformResponse(
+                url=transformed_url(item.public_id, item.width, item.height, item.crop, item.format),
+                public_id=item.public_id,
+                width=item.width,
+                height=item.height,
+                format=item.format or "auto"
+            )
+            for item in data.items
+        ]
+        return cached_transform_response(request, responses)
+    except Exception as e:
+        raise HTTPException(500, f"Failed to transform images: {str(e)}")
+
+@app.get("/transform/{public_id:path}", response_model=TransformResponse)
 async def transform_image(
     public_id: str,
+    request: Request,
     width: int = Query(300, ge=1, le=2000),
     height: int = Query(200, ge=1, le=2000),
     crop: str = Query("fill", pattern="^(fill|crop|scale|thumb)$"),
@@ -130,31 +401,68 @@ async def transform_image(
     """
     try:
         # Generate transformed URL
-        url = cloudinary.CloudinaryImage(public_id).build_url(
-            width=width,
-            height=height,
-            crop=crop,
-            format=format
-        )
-        return TransformResponse(
+        url = transformed_url(public_id, width, height, crop, format)
+        return cached_transform_response(request, TransformResponse(
             url=url,
+            public_id=public_id,
             width=width,
             height=height,
             format=format or "auto"
-        )
+        ))
     except Exception as e:
         raise HTTPException(500, f"Failed to transform image: {str(e)}")
 
-@app.delete("/{public_id}")
+@app.get("/files/{public_id:path}")
+async def serve_file(
+    public_id: str,
+    w: Optional[int] = Query(None, ge=1, le=2000),
+    h: Optional[int] = Query(None, ge=1, le=2000),
+    crop: str = Query("fill", pattern="^(fill|crop|scale|thumb)$"),
+    format: Optional[str] = Query(None, pattern="^(jpeg|png|gif|webp)$"),
+):
+    """
+    Serve an image kept by the local disk backend, resized when w and h are given.
+    Resized variants are rendered once and then served from the disk cache.
+    """
+    if not isinstance(storage_backend, LocalDiskBackend):
+        raise HTTPException(404, "Not found")
+    try:
+        if w and h:
+            found = await run_in_threadpool(storage_backend.variant, public_id, w, h, crop, format)
+        else:
+            found = storage_backend.original(public_id)
+        if found is None:
+            raise HTTPException(404, "Image not found")
+        path, image_format = found
+        return FileResponse(
+            path,
+            media_type=f"image/{image_format}",
+            headers={"Cache-Control": f"public, max-age={TRANSFORM_CACHE_MAX_AGE}, immutable"}
+        )
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(500, f"Failed to serve image: {str(e)}")
+
+@app.delete("/{public_id:path}")
 async def delete_image(
     public_id: str,
     # current_user: dict = Depends(require_role("admin"))
 ):
     """
-    Delete an image from Cloudinary (admin only)
+    Delete an image and its thumbnail variants from storage (admin only)
     """
     try:
-        result = cloudinary.uploader.destroy(public_id)
+        variant_ids = {}
+        if image_index is not None:
+            released = await image_index.release(public_id)
+            if released is not None:
+                if released["refs"]:
+                    return {"message": "Image is still used by other uploads and was kept", "result": {"refs": released["refs"]}}
+                variant_ids = released["variant_ids"]
+        result = await run_in_threadpool(storage_backend.delete, public_id)
+        for variant_id in variant_ids.values():
+            await run_in_threadpool(storage_backend.delete, variant_id)
         return {"message": "Image deleted successfully", "result": result}
     except Exception as e:
         raise HTTPException(500, str(e))
@@ -164,7 +472,8 @@ async def health_check():
     """
     Health check endpoint
     """
-    return {"status": "healthy", "service": SERVICE_NAME}
+    return {"status": "healthy", "service": SERVICE_NAME, "uploads": upload_pool.stats(),
+            "transform_url_cache": transformed_url.cache_info()._asdict(), "jobs": job_queue.stats()}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,102 @@
+import asyncio
+import io
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from PIL import Image, ImageOps
+
+# (name, contents, format, width, height)
+Variant = Tuple[str, bytes, str, int, int]
+
+
+def _encode(image: Image.Image, format: str, quality: int) -> bytes:
+    if format == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    # Nothing but pixels is written: EXIF, GPS and ICC metadata are dropped
+    image.save(output, format=format.upper(), quality=quality, method=4)
+    return output.getvalue()
+
+
+def process_image(contents: bytes, max_edge: int, thumbnail_edges: Tuple[int, ...],
+                  quality: int = 80, format: str = "webp") -> List[Variant]:
+    """Downsize, strip metadata and re-encode an image, plus one thumbnail per edge length.
+
+    Runs in a worker process. Animated images are returned untouched as the
+    only variant, since re-encoding would drop or flatten their frames.
+    """
+    with Image.open(io.BytesIO(contents)) as source:
+        if getattr(source, "is_animated", False):
+            return [("full", contents, source.format.lower(), source.width, source.height)]
+        # Phone photos are often stored sideways with an EXIF rotation
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    variants = []
+    full = image.copy()
+    full.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    variants.append(("full", _encode(full, format, quality), format, full.width, full.height))
+    for edge in sorted(set(thumbnail_edges)):
+        if edge >= max(full.size):
+            continue
+        thumbnail = full.copy()
+        thumbnail.thumbnail((edge, edge), Image.LANCZOS)
+        variants.append((f"w{edge}", _encode(thumbnail, format, quality), format, thumbnail.width, thumbnail.height))
+    return variants
+
+
+def render_transform(contents: bytes, width: int, height: int, crop: str, format: str, quality: int = 80) -> bytes:
+    """Resize an image the way the matching Cloudinary crop mode would"""
+    with Image.open(io.BytesIO(contents)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+    if crop == "scale":
+        image = image.resize((width, height), Image.LANCZOS)
+    elif crop == "crop":
+        # Centre crop at the original scale
+        left = max(0, (image.width - width) // 2)
+        top = max(0, (image.height - height) // 2)
+        image = image.crop((left, top, left + min(width, image.width), top + min(height, image.height)))
+    else:
+        # fill and thumb both cover the box and trim the overflow
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    return _encode(image, format, quality)
+
+
+def perceptual_hash(contents: bytes) -> str:
+    """64-bit difference hash: near identical images (re-saved, resized) share it"""
+    with Image.open(io.BytesIO(contents)) as image:
+        image.draft("L", (64, 64))
+        pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return f"{bits:016x}"
+
+
+class ImageProcessor:
+    """Runs process_image on a process pool so resizing and encoding use every core off the event loop"""
+
+    def __init__(self, max_edge: int = 2048, thumbnail_edges: Tuple[int, ...] = (320, 640),
+                 quality: int = 80, format: str = "webp", max_workers: int = 2):
+        self.max_edge = max_edge
+        self.thumbnail_edges = tuple(thumbnail_edges)
+        self.quality = quality
+        self.format = format
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    async def process(self, contents: bytes) -> List[Variant]:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, process_image, contents, self.max_edge, self.thumbnail_edges, self.quality, self.format
+        )
+
+    async def perceptual_hash(self, contents: bytes) -> str:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, perceptual_hash, contents)
+
+    def profile(self) -> str:
+        """Settings that shape the stored variants; images processed differently are not duplicates"""
+        return f"{self.format}:{self.max_edge}:{','.join(map(str, self.thumbnail_edges))}:{self.quality}"
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
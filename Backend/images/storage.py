@@ -0,0 +1,174 @@
+import glob
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional, Tuple
+
+import cloudinary
+import cloudinary.uploader
+
+from processing import render_transform
+
+_FOLDER_SEGMENT = re.compile(r"^[A-Za-z0-9_-]+$")
+_OBJECT_NAME = re.compile(r"^[0-9a-f]{64}-[0-9a-f]{12}$")
+
+
+class CloudinaryBackend:
+    """Stores images on Cloudinary"""
+
+    name = "cloudinary"
+
+    def __init__(self, cloud_name: Optional[str], api_key: Optional[str], api_secret: Optional[str],
+                 sign_urls: bool = False):
+        cloudinary.config(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+        self.sign_urls = sign_urls
+
+    def upload(self, contents: bytes, folder: str, format: str, timeout: Optional[float] = None) -> dict:
+        result = cloudinary.uploader.upload(
+            io.BytesIO(contents),
+            folder=folder,
+            resource_type="auto",
+            format=format,
+            timeout=timeout
+        )
+        return {"url": result['secure_url'], "public_id": result['public_id']}
+
+    def delete(self, public_id: str) -> dict:
+        return cloudinary.uploader.destroy(public_id)
+
+    def build_url(self, public_id: str, width: int, height: int, crop: str, format: Optional[str]) -> str:
+        return cloudinary.CloudinaryImage(public_id).build_url(
+            width=width,
+            height=height,
+            crop=crop,
+            format=format,
+            sign_url=self.sign_urls
+        )
+
+
+class StubBackend:
+    """Keeps uploads in memory after sleeping `latency` seconds, for tests and benchmarks.
+
+    With `fail_every` set, every n-th upload raises, to exercise partial failures.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0, fail_every: int = 0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.images = {}
+        self._uploads = 0
+        self._lock = threading.Lock()
+
+    def upload(self, contents: bytes, folder: str, format: str, timeout: Optional[float] = None) -> dict:
+        time.sleep(self.latency)
+        with self._lock:
+            self._uploads += 1
+            attempt = self._uploads
+        if self.fail_every and attempt % self.fail_every == 0:
+            raise RuntimeError("stub upload failure")
+        public_id = f"{folder}/{uuid.uuid4().hex}"
+        self.images[public_id] = bytes(contents)
+        return {"url": f"stub://{public_id}.{format}", "public_id": public_id}
+
+    def delete(self, public_id: str) -> dict:
+        return {"result": "ok" if self.images.pop(public_id, None) is not None else "not found"}
+
+    def build_url(self, public_id: str, width: int, height: int, crop: str, format: Optional[str]) -> str:
+        return f"stub://{public_id}?w={width}&h={height}&c={crop}" + (f"&f={format}" if format else "")
+
+
+class LocalDiskBackend:
+    """Stores images on local disk, for air-gapped staging and load tests.
+
+    Object names are the content's SHA-256 plus a per upload suffix, so two
+    uploads of the same bytes are separate objects and deleting one leaves
+    the other: public_id `<folder>/<sha256>-<suffix>` lives at
+    `<root>/objects/<folder>/<sha256[:2]>/<sha256>-<suffix>.<format>`. URLs point at
+    this service's /files route, which sends the file straight from disk;
+    transformed variants are rendered on first request and kept under
+    `<root>/variants`.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+
+    def _split(self, public_id: str):
+        """Return (folder, object name) of a well formed public_id, or None"""
+        folder, _, name = public_id.rpartition("/")
+        if not folder or not _OBJECT_NAME.match(name):
+            return None
+        if not all(_FOLDER_SEGMENT.match(segment) for segment in folder.split("/")):
+            return None
+        return folder, name
+
+    def _write(self, path: str, contents: bytes):
+        # Written under a temporary name and renamed, so readers never see a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(contents)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def original(self, public_id: str) -> Optional[Tuple[str, str]]:
+        """Return (path, format) of a stored image"""
+        parts = self._split(public_id)
+        if parts is None:
+            return None
+        folder, name = parts
+        matches = glob.glob(os.path.join(self.root, "objects", folder, name[:2], f"{name}.*"))
+        if not matches:
+            return None
+        return matches[0], matches[0].rsplit(".", 1)[1]
+
+    def variant(self, public_id: str, width: int, height: int, crop: str,
+                format: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Return (path, format) of a transformed image, rendering it on first use"""
+        original = self.original(public_id)
+        if original is None:
+            return None
+        source_path, source_format = original
+        format = format or source_format
+        folder, name = self._split(public_id)
+        path = os.path.join(self.root, "variants", folder, name, f"{width}x{height}_{crop}.{format}")
+        if not os.path.exists(path):
+            with open(source_path, "rb") as source:
+                self._write(path, render_transform(source.read(), width, height, crop, format))
+        return path, format
+
+    def upload(self, contents: bytes, folder: str, format: str, timeout: Optional[float] = None) -> dict:
+        if not all(_FOLDER_SEGMENT.match(segment) for segment in folder.split("/")):
+            raise ValueError(f"Invalid folder name: {folder}")
+        name = f"{hashlib.sha256(contents).hexdigest()}-{uuid.uuid4().hex[:12]}"
+        public_id = f"{folder}/{name}"
+        self._write(os.path.join(self.root, "objects", folder, name[:2], f"{name}.{format}"), contents)
+        return {"url": f"{self.base_url}/files/{public_id}", "public_id": public_id}
+
+    def delete(self, public_id: str) -> dict:
+        original = self.original(public_id)
+        if original is None:
+            return {"result": "not found"}
+        folder, name = self._split(public_id)
+        os.unlink(original[0])
+        shutil.rmtree(os.path.join(self.root, "variants", folder, name), ignore_errors=True)
+        return {"result": "ok"}
+
+    def build_url(self, public_id: str, width: int, height: int, crop: str, format: Optional[str]) -> str:
+        url = f"{self.base_url}/files/{public_id}?w={width}&h={height}&crop={crop}"
+        return url + (f"&format={format}" if format else "")
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The service modules import each other by bare name, as when run from Backend/images
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main reads these at import: uploads go to the in memory stub, with no database behind it
+os.environ["IMAGE_STORAGE_BACKEND"] = "stub"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ["IMAGE_DEDUP"] = "0"
+os.environ["JOB_QUEUE_DURABLE"] = "0"
+os.environ["IMAGE_PROCESSING"] = "0"
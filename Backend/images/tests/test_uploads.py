@@ -0,0 +1,115 @@
+"""UploadPool and the /upload route against the in memory StubBackend"""
+import asyncio
+import io
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from storage import StubBackend
+from uploads import UploadPool
+
+
+class StaggeredBackend(StubBackend):
+    """Stub whose earlier uploads finish last, so completion order is the reverse of request order"""
+
+    def upload(self, contents, folder, format, timeout=None):
+        time.sleep(0.05 * (10 - contents[0]))
+        return super().upload(contents, folder, format, timeout)
+
+
+def png(width: int, height: int) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_results_keep_request_order():
+    backend = StaggeredBackend()
+    pool = UploadPool(backend, max_workers=4)
+    images = [(bytes([n]) * 16, "jpeg") for n in range(4)]
+    try:
+        results = asyncio.run(pool.upload_many(images, "product"))
+    finally:
+        pool.shutdown()
+    assert [backend.images[result["public_id"]] for result in results] == [contents for contents, _ in images]
+
+
+def test_failures_are_returned_in_place():
+    pool = UploadPool(StubBackend(fail_every=2), max_workers=1)
+    try:
+        results = asyncio.run(pool.upload_many([(b"x", "png")] * 4, "product"))
+    finally:
+        pool.shutdown()
+    assert [isinstance(result, RuntimeError) for result in results] == [False, True, False, True]
+
+
+def test_each_upload_gets_its_own_timeout():
+    pool = UploadPool(StubBackend(latency=0.5), max_workers=2, timeout=0.1)
+    try:
+        results = asyncio.run(pool.upload_many([(b"x", "png")] * 2, "product"))
+    finally:
+        pool.shutdown()
+    assert all(isinstance(result, asyncio.TimeoutError) for result in results)
+
+
+def test_timeout_starts_once_a_worker_is_free():
+    # The second upload queues behind the first for longer than the timeout, yet still succeeds
+    pool = UploadPool(StubBackend(latency=0.15), max_workers=1, timeout=0.3)
+    try:
+        results = asyncio.run(pool.upload_many([(b"x", "png")] * 2, "product"))
+    finally:
+        pool.shutdown()
+    assert not any(isinstance(result, BaseException) for result in results)
+
+
+@pytest.fixture(scope="module")
+def service():
+    import main
+    # The lifespan shuts the upload pool down, so one client serves the whole module
+    with TestClient(main.app) as client:
+        yield main, client
+
+
+@pytest.fixture
+def backend(service):
+    main, _ = service
+    backend = main.upload_pool.backend
+    backend.images.clear()
+    backend._uploads = 0
+    yield backend
+    backend.fail_every = 0
+
+
+def upload(client, images):
+    files = [("file", (f"photo{n}.png", contents, "image/png")) for n, contents in enumerate(images)]
+    return client.post("/upload", files=files)
+
+
+def test_upload_route_keeps_file_order(service, backend):
+    _, client = service
+    images = [png(40 + 10 * n, 30) for n in range(3)]
+    response = upload(client, images)
+    assert response.status_code == 200
+    body = response.json()
+    assert [item["size"] for item in body] == [len(contents) for contents in images]
+    assert [backend.images[item["public_id"]] for item in body] == images
+
+
+def test_upload_route_reports_partial_failure(service, backend):
+    _, client = service
+    backend.fail_every = 3
+    images = [png(40 + 10 * n, 30) for n in range(3)]
+    response = upload(client, images)
+    assert response.status_code == 502
+    detail = response.json()["detail"]
+    assert detail["message"] == "1 of 3 images failed to upload"
+    assert len(detail["failed"]) == 1
+    failed = detail["failed"][0]
+    assert failed["error"] == "stub upload failure"
+    assert failed["filename"] == f"photo{failed['index']}.png"
+    # What did upload is listed in request order, skipping the failed file
+    assert [item["size"] for item in detail["uploaded"]] == [
+        len(contents) for n, contents in enumerate(images) if n != failed["index"]
+    ]
@@ -0,0 +1,47 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+
+class UploadPool:
+    """Pushes images to the storage backend concurrently on a bounded thread pool.
+
+    Backend uploads are blocking network calls, so they run on `max_workers`
+    threads instead of the event loop. Each upload gets `timeout` seconds;
+    a timed out upload is reported as failed, although its thread runs until
+    the backend's own timeout (given the same value) gives up.
+    """
+
+    def __init__(self, backend, max_workers: int = 4, timeout: float = 30):
+        self.backend = backend
+        self.timeout = timeout
+        self._in_flight = 0
+        self._slots = asyncio.Semaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+
+    async def _upload(self, contents: bytes, folder: str, format: str) -> dict:
+        # The timeout starts once a worker is free, not while queued behind other files
+        async with self._slots:
+            self._in_flight += 1
+            try:
+                return await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(
+                        self._executor, self.backend.upload, contents, folder, format, self.timeout
+                    ),
+                    timeout=self.timeout
+                )
+            finally:
+                self._in_flight -= 1
+
+    async def upload_many(self, images: List[Tuple[bytes, str]], folder: str) -> list:
+        """Upload (contents, format) pairs and return, in the same order, each result or the exception it raised"""
+        return await asyncio.gather(
+            *(self._upload(contents, folder, format) for contents, format in images),
+            return_exceptions=True
+        )
+
+    def stats(self) -> dict:
+        return {"backend": self.backend.name, "in_flight": self._in_flight}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
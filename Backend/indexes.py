@@ -0,0 +1,135 @@
+"""
+Idempotent collection and index bootstrap shared by the services.
+
+Each service runs bootstrap() from its FastAPI lifespan with the specs for
+the collections it owns. Index specs are (keys, options) pairs and must be
+named, so an existing index with the same name but a different definition
+is reported as drift rather than silently rebuilt.
+
+    python indexes.py    # print the drift report for every collection
+"""
+from typing import Dict, List, Tuple
+from pymongo.database import Database
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+IndexSpec = Tuple[list, dict]
+
+USER_INDEXES: List[IndexSpec] = [
+    ([("email", 1)], {"name": "email_unique", "unique": True}),
+    ([("google_id", 1)], {
+        "name": "google_id_unique",
+        "unique": True,
+        "partialFilterExpression": {"google_id": {"$type": "string"}}
+    }),
+]
+
+# Duplicate listing check in add_product
+PRODUCT_INDEXES: List[IndexSpec] = [
+    ([("title", 1), ("category", 1)], {"name": "title_category"}),
+]
+
+WISHLIST_INDEXES: List[IndexSpec] = [
+    ([("user_id", 1), ("product_id", 1)], {"name": "user_product_unique", "unique": True}),
+    ([("product_id", 1)], {"name": "product_id"}),
+]
+
+# Content hash -> stored image lookups of the image service
+IMAGE_HASH_INDEXES: List[IndexSpec] = [
+    ([("public_id", 1)], {"name": "public_id"}),
+    ([("phash", 1)], {"name": "phash", "partialFilterExpression": {"phash": {"$type": "string"}}}),
+]
+
+# Recovery scan of the durable job queues (jobs.MongoJobStore)
+JOB_INDEXES: List[IndexSpec] = [
+    ([("status", 1), ("locked_until", 1)], {"name": "status_lease"}),
+]
+
+# Options that change what an index means; anything else (e.g. background) is ignored
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _definition(keys: list, options: dict) -> tuple:
+    return (
+        # The server may report directions as floats
+        [(field, int(direction) if isinstance(direction, (int, float)) else direction) for field, direction in keys],
+        {option: dict(options[option]) if isinstance(options[option], dict) else options[option]
+         for option in _COMPARED_OPTIONS if option in options}
+    )
+
+
+def index_drift(db: Database, specs: Dict[str, List[IndexSpec]]) -> dict:
+    """Compare the indexes in the database with the specs, per collection"""
+    report = {}
+    for name, collection_specs in specs.items():
+        existing = db.get_collection(name).index_information()
+        expected = {options["name"]: _definition(keys, options) for keys, options in collection_specs}
+        current = {
+            index_name: _definition(info["key"], info)
+            for index_name, info in existing.items() if index_name != "_id_"
+        }
+        report[name] = {
+            "missing": sorted(set(expected) - set(current)),
+            "mismatched": sorted(n for n in expected if n in current and current[n] != expected[n]),
+            "unexpected": sorted(set(current) - set(expected)),
+        }
+    return report
+
+
+def bootstrap(db: Database, specs: Dict[str, List[IndexSpec]]) -> dict:
+    """Create missing collections and indexes, then return the drift report.
+
+    Safe to run on every start: existing collections and matching indexes are
+    left alone, and mismatched ones are reported instead of dropped.
+    """
+    existing_collections = set(db.list_collection_names())
+    for name in specs:
+        if name not in existing_collections:
+            try:
+                db.create_collection(name)
+            except CollectionInvalid:
+                # Another worker created it first
+                pass
+
+    failed = {}
+    drift = index_drift(db, specs)
+    for name, collection_specs in specs.items():
+        for keys, options in collection_specs:
+            if options["name"] not in drift[name]["missing"]:
+                continue
+            try:
+                db.get_collection(name).create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. duplicates that block a unique index
+                failed.setdefault(name, []).append(f"{options['name']}: {e}")
+
+    report = index_drift(db, specs)
+    for name, errors in failed.items():
+        report[name]["failed"] = errors
+    for name, entry in report.items():
+        if any(entry.values()):
+            print(f"Index drift on {name}: {entry}")
+    return report
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    from database import close_clients, get_database
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.join(here, "products"))
+    from search import SEARCH_INDEXES
+    from pagination import SORT_INDEXES
+
+    database = get_database()
+    all_specs = {
+        "User": USER_INDEXES,
+        "Product": PRODUCT_INDEXES + SEARCH_INDEXES + SORT_INDEXES,
+        "Wishlist": WISHLIST_INDEXES,
+        "ImageHash": IMAGE_HASH_INDEXES,
+        "ProductJob": JOB_INDEXES,
+        "ImageJob": JOB_INDEXES,
+    }
+    for collection_name, entry in index_drift(database, all_specs).items():
+        print(f"{collection_name}: {entry}")
+    close_clients()
@@ -0,0 +1,235 @@
+"""
+Lightweight background job queue shared by the services.
+
+Handlers do slow side work (deleting images, recounting totals) after the
+response is sent. Jobs run on a few asyncio worker tasks in the same
+process and are retried with exponential backoff when they raise. With a
+MongoJobStore every job is written to the Job collection first, so jobs
+left behind by a crashed or restarted worker are picked up again on the
+next start.
+
+    queue = JobQueue(workers=2)
+
+    @queue.job("delete_images")
+    async def delete_images(urls: list):
+        ...
+
+    await queue.enqueue("delete_images", urls=[...])
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from pymongo.collection import Collection
+from starlette.concurrency import run_in_threadpool
+
+
+class MongoJobStore:
+    """Keeps queued jobs in a collection so they survive restarts.
+
+    A worker leases a job for `lease` seconds while running it; a lease
+    that runs out (the worker died) makes the job claimable again.
+    """
+
+    def __init__(self, collection: Collection, lease: float = 300):
+        self.collection = collection
+        self.lease = lease
+
+    def add(self, job: dict):
+        self.collection.insert_one({**job, "status": "pending", "created_at": datetime.now(timezone.utc)})
+
+    def claim(self, job_id: str) -> bool:
+        now = datetime.now(timezone.utc)
+        # A job waiting out its retry backoff is not claimable before run_at
+        return self.collection.find_one_and_update(
+            {"_id": job_id, "$and": [
+                {"$or": [{"status": "pending"}, {"status": "running", "locked_until": {"$lt": now}}]},
+                {"$or": [{"run_at": {"$exists": False}}, {"run_at": {"$lte": now}}]}
+            ]},
+            {"$set": {"status": "running", "locked_until": now + timedelta(seconds=self.lease)}},
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER
+        ) is not None
+
+    def retry(self, job_id: str, attempts: int, delay: float, error: str):
+        self.collection.update_one({"_id": job_id}, {"$set": {
+            "status": "pending",
+            "attempts": attempts,
+            "run_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            "last_error": error
+        }})
+
+    def complete(self, job_id: str):
+        self.collection.delete_one({"_id": job_id})
+
+    def fail(self, job_id: str, attempts: int, error: str):
+        # Failed jobs are kept for inspection
+        self.collection.update_one({"_id": job_id}, {"$set": {"status": "failed", "attempts": attempts, "last_error": error}})
+
+    def unfinished(self) -> list:
+        now = datetime.now(timezone.utc)
+        return list(self.collection.find(
+            {"$or": [{"status": "pending"}, {"status": "running", "locked_until": {"$lt": now}}]},
+            {"name": 1, "payload": 1, "attempts": 1, "run_at": 1, "enqueued_at": 1}
+        ))
+
+
+class JobQueue:
+    """In-process async job queue with retries, backoff and queue metrics.
+
+    A job that raises is retried up to `max_attempts` times in all, waiting
+    `base_delay` seconds doubled on every attempt (capped at `max_delay`)
+    plus jitter. Only `max_size` jobs may wait; beyond that enqueue() drops
+    the job and returns False rather than failing a request whose write has
+    already committed. A dropped job already written to the store still runs
+    after the next start.
+    """
+
+    def __init__(self, workers: int = 2, max_attempts: int = 5, base_delay: float = 1,
+                 max_delay: float = 300, max_size: int = 10000, store: Optional[MongoJobStore] = None):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.store = store
+        self._handlers: Dict[str, Callable] = {}
+        self._queue = asyncio.Queue(maxsize=max_size)
+        self._tasks = []
+        self._delayed = set()
+        self._running = 0
+        self._counts = {"enqueued": 0, "dropped": 0, "succeeded": 0, "retried": 0, "failed": 0}
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def job(self, name: str):
+        """Register the coroutine function that runs jobs called `name`"""
+        def register(handler: Callable):
+            self._handlers[name] = handler
+            return handler
+        return register
+
+    async def enqueue(self, name: str, **payload) -> bool:
+        """Queue a job and return whether it was accepted"""
+        if name not in self._handlers:
+            raise ValueError(f"No handler registered for job {name}")
+        job = {"_id": str(uuid4()), "name": name, "payload": payload, "attempts": 0, "enqueued_at": time.time()}
+        if self.store is not None:
+            await run_in_threadpool(self.store.add, job)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            print(f"Job queue full, dropped {name} job" + (" until the next start" if self.store is not None else ""))
+            self._counts["dropped"] += 1
+            return False
+        self._counts["enqueued"] += 1
+        return True
+
+    def _later(self, job: dict, delay: float):
+        async def wait():
+            await asyncio.sleep(delay)
+            try:
+                self._queue.put_nowait(job)
+            except asyncio.QueueFull:
+                # Try again after another wait rather than lose a retry
+                self._later(job, delay)
+        task = asyncio.get_running_loop().create_task(wait())
+        self._delayed.add(task)
+        task.add_done_callback(self._delayed.discard)
+
+    async def _run(self, job: dict):
+        if self.store is not None and not await run_in_threadpool(self.store.claim, job["_id"]):
+            # Another worker has it
+            return
+        self._running += 1
+        try:
+            await self._handlers[job["name"]](**job["payload"])
+        except Exception as e:
+            job["attempts"] += 1
+            error = f"{type(e).__name__}: {str(e)}"
+            if job["attempts"] >= self.max_attempts:
+                print(f"Job {job['name']} failed after {job['attempts']} attempts: {error}")
+                self._counts["failed"] += 1
+                if self.store is not None:
+                    await run_in_threadpool(self.store.fail, job["_id"], job["attempts"], error)
+                return
+            delay = min(self.base_delay * 2 ** (job["attempts"] - 1), self.max_delay) * random.uniform(1, 1.5)
+            print(f"Job {job['name']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+            self._counts["retried"] += 1
+            if self.store is not None:
+                await run_in_threadpool(self.store.retry, job["_id"], job["attempts"], delay, error)
+            self._later(job, delay)
+            return
+        finally:
+            self._running -= 1
+        latency = time.time() - job["enqueued_at"]
+        self._latency_total += latency
+        self._latency_max = max(self._latency_max, latency)
+        self._counts["succeeded"] += 1
+        if self.store is not None:
+            await run_in_threadpool(self.store.complete, job["_id"])
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                # A store outage must not kill the worker
+                print(f"Job worker error: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    async def start(self):
+        """Start the workers and pick up jobs left unfinished in the store"""
+        if self.store is not None:
+            for doc in await run_in_threadpool(self.store.unfinished):
+                if doc.get("name") not in self._handlers:
+                    continue
+                job = {
+                    "_id": doc["_id"], "name": doc["name"], "payload": doc.get("payload") or {},
+                    "attempts": doc.get("attempts", 0), "enqueued_at": doc.get("enqueued_at", time.time())
+                }
+                run_at = doc.get("run_at")
+                if run_at is not None:
+                    delay = (run_at.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).total_seconds()
+                    if delay > 0:
+                        self._later(job, delay)
+                        continue
+                try:
+                    self._queue.put_nowait(job)
+                except asyncio.QueueFull:
+                    # The rest stay in the store for the next start
+                    print("Job queue full, leaving unfinished jobs in the store")
+                    break
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10):
+        """Give queued jobs up to `timeout` seconds to finish, then stop the workers.
+
+        Jobs still queued are lost unless a store is configured, in which case
+        the next start picks them up.
+        """
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Stopping job queue with {self._queue.qsize()} jobs still queued")
+        for task in list(self._tasks) + list(self._delayed):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._delayed, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        done = self._counts["succeeded"]
+        return {
+            "depth": self._queue.qsize(),
+            "delayed": len(self._delayed),
+            "running": self._running,
+            **self._counts,
+            "avg_latency_ms": round(self._latency_total / done * 1000, 1) if done else 0.0,
+            "max_latency_ms": round(self._latency_max * 1000, 1),
+        }
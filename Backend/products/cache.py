@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class LRUCache:
+    """Bounded least recently used cache with optional expiry and hit/miss/eviction counters"""
+
+    def __init__(self, max_entries: int, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return a live entry without touching recency or counters"""
+        entry = self._entries.get(key)
+        if entry is None or (entry[0] is not None and entry[0] < time.monotonic()):
+            return None
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# Marks users whose wishlist is too large to hold in memory
+OVERSIZE = object()
+
+
+class WishlistCache:
+    """Per user sets of wishlisted product IDs, kept in process.
+
+    get() returns None when the user is not cached and OVERSIZE when the
+    wishlist is larger than max_items and must be queried directly.
+    """
+
+    def __init__(self, max_users: int = 10000, max_items: int = 1000, ttl: Optional[float] = 300):
+        self.max_items = max_items
+        self._users = LRUCache(max_users, ttl)
+
+    async def get(self, user_id: str):
+        return self._users.get(user_id)
+
+    async def set(self, user_id: str, product_ids: set):
+        self._users.set(user_id, OVERSIZE if len(product_ids) > self.max_items else set(product_ids))
+
+    async def add(self, user_id: str, product_id: str):
+        product_ids = self._users.peek(user_id)
+        if isinstance(product_ids, set):
+            product_ids.add(product_id)
+            if len(product_ids) > self.max_items:
+                self._users.set(user_id, OVERSIZE)
+
+    async def remove(self, user_id: str, product_id: str):
+        product_ids = self._users.peek(user_id)
+        if isinstance(product_ids, set):
+            product_ids.discard(product_id)
+
+    async def invalidate(self, user_id: str):
+        self._users.pop(user_id)
+
+    def stats(self) -> dict:
+        return {"backend": "memory", **self._users.stats()}
+
+
+class RedisWishlistCache:
+    """Per user sets of wishlisted product IDs in a Redis compatible store shared by all workers.
+
+    Memory is bounded by a per key TTL and the server's maxmemory policy.
+    """
+
+    # Redis drops empty sets, so every cached set carries this member
+    LOADED = "__loaded__"
+    OVERSIZE_MARK = "__oversize__"
+
+    def __init__(self, url: str, max_items: int = 1000, ttl: int = 300):
+        import redis.asyncio as aioredis
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, user_id: str) -> str:
+        return f"wishlist:{user_id}"
+
+    async def get(self, user_id: str):
+        members = await self.redis.smembers(self._key(user_id))
+        # A set without the marker was only partially written around an expiry
+        if self.LOADED not in members:
+            self.misses += 1
+            return None
+        self.hits += 1
+        members.discard(self.LOADED)
+        return OVERSIZE if self.OVERSIZE_MARK in members else members
+
+    async def set(self, user_id: str, product_ids: set):
+        key = self._key(user_id)
+        members = [self.LOADED, self.OVERSIZE_MARK] if len(product_ids) > self.max_items else [self.LOADED, *product_ids]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.sadd(key, *members)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def add(self, user_id: str, product_id: str):
+        key = self._key(user_id)
+        # Only touch sets that are already loaded, a missing key is filled on next read
+        if await self.redis.sismember(key, self.LOADED):
+            await self.redis.sadd(key, product_id)
+
+    async def remove(self, user_id: str, product_id: str):
+        await self.redis.srem(self._key(user_id), product_id)
+
+    async def invalidate(self, user_id: str):
+        await self.redis.delete(self._key(user_id))
+
+    def stats(self) -> dict:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "evictions": None}
@@ -0,0 +1,111 @@
+import asyncio
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict
+
+from pymongo.errors import BulkWriteError
+
+# Counter fields that may be incremented through the buffer
+COUNTER_FIELDS = ("views", "likes")
+
+
+class CounterBuffer:
+    """Accumulates per product counter increments in memory and writes them in batches.
+
+    incr() only touches a dict, so a hot listing costs one $inc per flush
+    instead of one write per view. Pending increments are flushed every
+    `interval` seconds, as soon as `max_products` products have some, and on
+    shutdown. Increments a flush failed to write are merged back and retried
+    on the next one, so counts are eventually consistent; increments still
+    buffered when the process dies are lost.
+    """
+
+    def __init__(self, apply: Callable[[Dict[str, Dict[str, int]]], Awaitable], interval: float = 2,
+                 max_products: int = 1000):
+        self.apply = apply
+        self.interval = interval
+        self.max_products = max_products
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stopping = False
+        self._stats = {"increments": 0, "flushes": 0, "writes": 0, "flush_failures": 0}
+        self._last_flush_ms = 0.0
+
+    def incr(self, product_id: str, field: str, amount: int = 1):
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"{field} is not a counter")
+        self._pending[product_id][field] += amount
+        self._stats["increments"] += 1
+        if len(self._pending) >= self.max_products:
+            self._wake.set()
+
+    def pending(self, product_id: str) -> Dict[str, int]:
+        """Increments for a product not yet written"""
+        return dict(self._pending.get(product_id, {}))
+
+    async def flush(self) -> int:
+        """Write every pending increment in one bulk write and return how many products it touched"""
+        if not self._pending:
+            return 0
+        batch = {product_id: {field: n for field, n in fields.items() if n} for product_id, fields in self._pending.items()}
+        batch = {product_id: fields for product_id, fields in batch.items() if fields}
+        self._pending = defaultdict(lambda: defaultdict(int))
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            await self.apply(batch)
+        except BulkWriteError as e:
+            # The bulk write is unordered: every operation not listed as failed was applied,
+            # so only the failed ones are put back, in batch order
+            product_ids = list(batch)
+            self._merge({product_ids[error["index"]]: batch[product_ids[error["index"]]]
+                         for error in e.details.get("writeErrors", [])})
+            self._stats["flush_failures"] += 1
+            raise
+        except Exception:
+            # Put the batch back so its increments are written by a later flush
+            self._merge(batch)
+            self._stats["flush_failures"] += 1
+            raise
+        self._stats["flushes"] += 1
+        self._stats["writes"] += len(batch)
+        self._last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        return len(batch)
+
+    def _merge(self, batch: Dict[str, Dict[str, int]]):
+        for product_id, fields in batch.items():
+            for field, n in fields.items():
+                self._pending[product_id][field] += n
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Counter flush failed: {str(e)}")
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        # The loop is woken rather than cancelled so a flush in progress is never cut short
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Final counter flush failed: {str(e)}")
+
+    def stats(self) -> dict:
+        return {"pending_products": len(self._pending), "last_flush_ms": self._last_flush_ms, **self._stats}
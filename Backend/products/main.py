@@ -1,17 +1,18 @@
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from fastapi import *
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse, RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from pymongo import *
+from pymongo.errors import DuplicateKeyError
 import os
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 from fastapi.middleware.cors import CORSMiddleware
-from jwt import JWT, jwk_from_dict
 from typing import Optional, List
 from bson import ObjectId
 from schema import *
 from starlette.requests import Request
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 from authlib.integrations.starlette_client import OAuth, OAuthError
 from jwt.exceptions import JWTDecodeError
@@ -19,9 +20,51 @@ from google.auth.transport import requests as google_requests
 from google.oauth2 import id_token
 from authlib.integrations.starlette_client import OAuth, OAuthError
 from uuid import uuid4
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tokens import TokenCodec
+from caches import TTLCache
+from indexes import JOB_INDEXES, PRODUCT_INDEXES, WISHLIST_INDEXES, bootstrap
+from jobs import JobQueue, MongoJobStore
+from database import close_clients, get_async_database, pool_stats
+from repository import ProductRepository, WishlistRepository
+from pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SORT_INDEXES, SORT_OPTIONS,
+    apply_cursor, build_projection, next_cursor, sort_spec
+)
+from search import SEARCH_INDEXES, FACET_FIELDS, build_filter, build_search_fields, backfill_search_fields, facet_pipeline
+from cache import LRUCache, WishlistCache, RedisWishlistCache, OVERSIZE
+from counters import COUNTER_FIELDS, CounterBuffer
+import json
+import re
+import httpx
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db1, products_repo, wishlist_repo
+    # One pooled client per worker, opened here rather than at import
+    db1 = get_async_database()
+    products_repo = ProductRepository(db1)
+    wishlist_repo = WishlistRepository(db1)
+    # Indexes and normalized search fields must exist before queries rely on them
+    app.state.index_report = await run_in_threadpool(bootstrap, db1.delegate, {
+        "Product": PRODUCT_INDEXES + SEARCH_INDEXES + SORT_INDEXES,
+        "Wishlist": WISHLIST_INDEXES,
+        **({"ProductJob": JOB_INDEXES} if JOB_QUEUE_DURABLE else {})
+    })
+    await backfill_search_fields(products_repo.collection)
+    if JOB_QUEUE_DURABLE:
+        job_queue.store = MongoJobStore(db1.delegate.get_collection("ProductJob"))
+    await job_queue.start()
+    counter_buffer.start()
+    yield
+    await counter_buffer.stop()
+    await job_queue.stop()
+    close_clients()
 
 app = FastAPI(
-    title="Product service"
+    title="Product service",
+    lifespan=lifespan
 )
 
 # setup_middleware(app)
@@ -39,52 +82,89 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 load_dotenv()
 
-link = os.getenv("Database_Link")
-client1 = MongoClient(link)
-db1 = client1['SSRealEstate']
+# Set by lifespan
+db1 = None
+products_repo = None
+wishlist_repo = None
+# Side work (image deletion, owner item counts) runs here after the response is sent;
+# JOB_QUEUE_DURABLE=1 keeps queued jobs in the ProductJob collection across restarts
+JOB_QUEUE_DURABLE = os.getenv("JOB_QUEUE_DURABLE", "").lower() in ("1", "true", "yes")
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+)
+IMAGE_SERVICE_URL = os.getenv("IMAGE_SERVICE_URL")
+# View and like increments, written as one bulk $inc per flush
+counter_buffer = CounterBuffer(
+    lambda increments: products_repo.increment_counters(increments),
+    interval=float(os.getenv("COUNTER_FLUSH_INTERVAL", "2")),
+    max_products=int(os.getenv("COUNTER_FLUSH_MAX_PRODUCTS", "1000"))
+)
+# IDs of products known to exist, so view/like counts are only buffered for real products
+known_products = LRUCache(
+    max_entries=int(os.getenv("KNOWN_PRODUCTS_CACHE_SIZE", "50000")),
+    ttl=float(os.getenv("KNOWN_PRODUCTS_CACHE_TTL", "300"))
+)
 Secret_key = os.getenv("SECRET_KEY")
 algorithm = os.getenv("Algorithm")
-# Ensure indexes for fast search/filter
-# db1.get_collection('Product').create_index([("title", "text")])
-# # db1.get_collection('Product').create_index("category")
-# # db1.get_collection('Product').create_index("price")
-# # db1.get_collection('Product').create_index("owner_id")
-# db1.get_collection('Product').create_index("brand")
-# db1.get_collection('Product').create_index("color")
-# db1.get_collection('Product').create_index("size")
-# db1.get_collection('Product').create_index("condition")
-
-# Wishlist indexes
-# db1.get_collection('Wishlist').create_index([("user_id", 1), ("product_id", 1)], unique=True)
-# db1.get_collection('Wishlist').create_index("user_id")
-# db1.get_collection('Wishlist').create_index("product_id")
-
-
-def decode_Access_token(token: str):
+token_codec = TokenCodec(Secret_key, algorithm)
+# Built from SORT_OPTIONS so a new sort is accepted everywhere it is defined
+SORT_PATTERN = "^(" + "|".join(SORT_OPTIONS) + ")$"
+# Facet counts keyed by the normalized filter, dropped whenever a product is written
+facet_cache = TTLCache(ttl=float(os.getenv("FACET_CACHE_TTL", "30")))
+# token_version per session user; revocations take effect within this TTL
+session_version_cache = TTLCache(
+    ttl=float(os.getenv("SESSION_VERSION_CACHE_TTL", "60")),
+    max_entries=int(os.getenv("SESSION_VERSION_CACHE_SIZE", "10000"))
+)
+# Wishlisted product IDs per user, updated write-through by add/remove
+wishlist_cache_max_items = int(os.getenv("WISHLIST_CACHE_MAX_ITEMS", "1000"))
+if os.getenv("WISHLIST_CACHE_URL"):
+    wishlist_cache = RedisWishlistCache(os.getenv("WISHLIST_CACHE_URL"), max_items=wishlist_cache_max_items)
+else:
+    wishlist_cache = WishlistCache(
+        max_users=int(os.getenv("WISHLIST_CACHE_MAX_USERS", "10000")),
+        max_items=wishlist_cache_max_items
+    )
+
+
+async def session_version(payload: dict) -> Optional[int]:
+    """Current token_version of the session's user, None when the user no longer exists"""
+    key = payload.get("sub") or payload.get("email")
+    cached = session_version_cache.get(key)
+    if cached is not None:
+        return cached
+    sub = payload.get("sub")
+    # Sessions issued before slim tokens only carry the email
+    query = {"_id": ObjectId(sub)} if sub and ObjectId.is_valid(sub) else {"email": payload.get("email")}
+    user = await db1.get_collection('User').find_one(query, {"token_version": 1})
+    if user is None:
+        return None
+    version = user.get("token_version", 0)
+    session_version_cache.set(key, version)
+    return version
+
+
+async def decode_Access_token(token: str):
     try:
-        jwt_instance = JWT()
-        secret_key = jwk_from_dict({
-            "k": Secret_key,
-            "kty": "oct"
-        })
-        
-        current_time = datetime.now(timezone.utc)    
-        payload = jwt_instance.decode(token, secret_key, algorithms={algorithm} if algorithm else {"HS256"})
-        
-        exp = payload.get('exp')
-        if exp:
-            exp_time = datetime.fromtimestamp(exp, timezone.utc)
-            if current_time > exp_time:
-                raise HTTPException(status_code=401, detail="Token has expired")
+        # Expiry is checked while decoding
+        payload = token_codec.decode(token)
         
         email = payload.get("email")
         role = payload.get("role")
         
         if email is None or role is None:
             raise HTTPException(status_code=401, detail="Invalid token data")
+        # Sessions revoked by a token_version bump in the auth service are refused
+        version = await session_version(payload)
+        if version is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        if version != payload.get("ver", 0):
+            raise HTTPException(status_code=401, detail="Session has been revoked")
             
         token_data = {
             "email": str(email),
@@ -92,6 +172,8 @@ def decode_Access_token(token: str):
         }
         return token_data
         
+    except HTTPException as e:
+        raise e
     except JWTDecodeError as e:
         print(f"JWT decode error: {str(e)}")
         if "expired" in str(e).lower():
@@ -102,6 +184,69 @@ def decode_Access_token(token: str):
         raise HTTPException(status_code=401, detail=str(e))
 
 
+def image_public_id(url: str) -> Optional[str]:
+    """Image service public_id of a stored image URL (Cloudinary or the local /files backend)"""
+    match = (re.search(r"/image/upload/(?:.+/)?v\d+/([^?]+?)(?:\.\w+)?$", url)
+             or re.search(r"/image/upload/([^?]+?)(?:\.\w+)?$", url)
+             or re.search(r"/files/([^?]+)", url))
+    return match.group(1) if match else None
+
+
+@job_queue.job("delete_product_images")
+async def delete_product_images(urls: List[str]):
+    """Delete a removed product's images from the image service"""
+    public_ids = [public_id for public_id in map(image_public_id, urls) if public_id]
+    async with httpx.AsyncClient(base_url=IMAGE_SERVICE_URL, timeout=30) as client:
+        for public_id in public_ids:
+            result = await client.delete(f"/{public_id}")
+            # Already gone counts as done; anything else is retried
+            if result.status_code not in (200, 404):
+                raise RuntimeError(f"Image service returned {result.status_code} deleting {public_id}")
+
+
+@job_queue.job("recount_owner_items")
+async def recount_owner_items(owner_id: str):
+    """Refresh the items count on the owner's user record"""
+    count = await products_repo.collection.count_documents({"owner_id": owner_id})
+    await db1.get_collection('User').update_one({"email": owner_id}, {"$set": {"items": count}})
+
+
+async def wishlisted_among(user_email: str, product_ids: List[str]) -> set:
+    """Return which of the given products the user has wishlisted, from cache when possible"""
+    cached = await wishlist_cache.get(user_email)
+    if cached is None:
+        cached = await wishlist_repo.product_ids(user_email, limit=wishlist_cache_max_items + 1)
+        await wishlist_cache.set(user_email, cached)
+        if len(cached) > wishlist_cache_max_items:
+            cached = OVERSIZE
+    if cached is OVERSIZE:
+        return await wishlist_repo.wishlisted_ids(user_email, product_ids)
+    return cached.intersection(product_ids)
+
+
+async def fetch_page(response: Response, query: dict, limit: Optional[int], cursor: Optional[str],
+                     sort: Optional[str] = None, fields: Optional[str] = None, view: Optional[str] = None,
+                     user_email: Optional[str] = None):
+    """Run a paginated product query and send the next page token in X-Next-Cursor.
+
+    Without limit or cursor every match is returned, as before pagination existed.
+    When user_email is given every product carries an in_wishlist flag, looked up in one query.
+    """
+    if limit is None and cursor:
+        limit = DEFAULT_PAGE_SIZE
+    products, has_more = await products_repo.find_page(
+        apply_cursor(query, cursor, sort), limit, build_projection(fields, view, sort), sort_spec(sort)
+    )
+    if user_email and products:
+        wishlisted = await wishlisted_among(user_email, [p["_id"] for p in products])
+        for product in products:
+            product["in_wishlist"] = product["_id"] in wishlisted
+    token = next_cursor(products, has_more, sort)
+    if token:
+        response.headers["X-Next-Cursor"] = token
+    return products
+
+
 @app.post("/product")
 async def add_product(product: Product, request: Request):
     try:
@@ -115,7 +260,7 @@ async def add_product(product: Product, request: Request):
         session = request.cookies.get('session')
         if session:
             try:
-                user_data = decode_Access_token(session)
+                user_data = await decode_Access_token(session)
                 product_data["owner_id"] = user_data.get("email")
             except Exception as e:
                 print(f"Warning: could not decode token in add_product: {e}")
@@ -127,7 +272,7 @@ async def add_product(product: Product, request: Request):
         duplicate_query = {"title": normalized_title}
         if normalized_category:
             duplicate_query["category"] = normalized_category
-        existing_product = db1.get_collection('Product').find_one(duplicate_query, {"_id": 0})
+        existing_product = await products_repo.find_one(duplicate_query, {"_id": 0})
         if existing_product:
             raise HTTPException(status_code=400, detail="Product already exists")
 
@@ -135,7 +280,14 @@ async def add_product(product: Product, request: Request):
         if normalized_category:
             product_data["category"] = normalized_category
 
-        db1.get_collection('Product').insert_one(product_data)
+        await products_repo.insert({
+            **product_data,
+            "search": build_search_fields(product_data),
+            "updated_at": datetime.now(timezone.utc)
+        })
+        facet_cache.clear()
+        if product_data.get("owner_id"):
+            await job_queue.enqueue("recount_owner_items", owner_id=product_data["owner_id"])
         return {"message": "Product added successfully", "product": product_data}
 
     except HTTPException as e:
@@ -144,123 +296,55 @@ async def add_product(product: Product, request: Request):
         raise HTTPException(status_code=500, detail=f"Failed to add product: {str(e)}")
 
 @app.get("/product/all")
-async def get_all_products():
-    try:
-        products_cursor = db1.get_collection('Product').find()
-        products = []
-        for product in products_cursor:
-            # Convert ObjectId to string for JSON serialization
-            if "_id" in product:
-                product["_id"] = str(product["_id"])
-            products.append(product)
-        return products
-    except Exception as e:
-        print(f"Get all products error: {str(e)}")  # Debug log
-        raise HTTPException(status_code=500, detail=f"Failed to fetch products: {str(e)}")
-@app.get("/product/{product_id}")
-async def get_product(product_id: str):
+async def get_all_products(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    fields: Optional[str] = None,
+    view: Optional[str] = Query(None, pattern="^(full|card)$"),
+    user_email: Optional[str] = None
+):
+    """List products, a page at a time when limit or cursor is given; the next page token is sent in X-Next-Cursor"""
     try:
-        product = db1.get_collection('Product').find_one({"_id": product_id})
-        if not product:
-            raise HTTPException(status_code=404, detail="Product not found")
-        
-        # Convert ObjectId to string for JSON serialization
-        if "_id" in product:
-            product["_id"] = str(product["_id"])
-        
-        return product
+        return await fetch_page(response, {}, limit, cursor, sort, fields, view, user_email)
     except HTTPException as e:
         raise e
     except Exception as e:
-        print(f"Get product error: {str(e)}")  # Debug log
-        raise HTTPException(status_code=500, detail=f"Failed to fetch product: {str(e)}")
-
-@app.put("/product/{product_id}")
-async def update_product(product_id: str, product: Product):
-    try:
-        product_data = product.dict()
-        product_data["_id"] = product_id
-        product_data["id"] = product_id
-        result = db1.get_collection('Product').update_one({"_id": product_id}, {"$set": product_data})
-        return JSONResponse(status_code=200, content={"message": "Product updated successfully", "product_id": product_id})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.delete("/product/{product_id}")
-async def delete_product(product_id: str):
-    try:
-        result = db1.get_collection('Product').delete_one({"_id": product_id})
-        return JSONResponse(status_code=200, content={"message": "Product deleted successfully", "product_id": product_id})
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.get("/product/user/{user_id}")
-async def get_products_by_user(user_id: str):
-    try:
-        products_cursor = db1.get_collection('Product').find({"owner_id": user_id})
-        products = []
-        for product in products_cursor:
-            # Convert ObjectId to string for JSON serialization
-            if "_id" in product:
-                product["_id"] = str(product["_id"])
-            products.append(product)
-        return products
-    except Exception as e:
-        print(f"Get products by user error: {str(e)}")  # Debug log
-        raise HTTPException(status_code=500, detail=f"Failed to fetch user products: {str(e)}")
-
+        print(f"Get all products error: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Failed to fetch products: {str(e)}")
 @app.get("/product/search")
 async def search_products(
+    response: Response,
     title: Optional[str] = None,
     category: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_email: Optional[str] = None
 ):
     try:
-        query = {}
-        
-        # Handle title search with case-insensitive regex
-        if title and title.strip():
-            query["title"] = {"$regex": title.strip(), "$options": "i"}
-        
-        # Handle category search (case-insensitive)
-        if category and category.strip() and category.lower() != "all":
-            query["category"] = {"$regex": f"^{category.strip()}$", "$options": "i"}
-        
-        # Handle price range
-        if min_price is not None or max_price is not None:
-            query["price"] = {}
-            if min_price is not None and min_price > 0:
-                query["price"]["$gte"] = float(min_price)
-            if max_price is not None and max_price > 0:
-                query["price"]["$lte"] = float(max_price)
-            
-            # Remove empty price object
-            if not query["price"]:
-                del query["price"]
-        
+        query = build_filter(title=title, category=category, min_price=min_price, max_price=max_price)
         print(f"Search query: {query}")  # Debug log
         
         # Execute the query
-        products_cursor = db1.get_collection('Product').find(query)
-        products = []
-        
-        for product in products_cursor:
-            # Convert ObjectId to string for JSON serialization
-            if "_id" in product:
-                product["_id"] = str(product["_id"])
-            products.append(product)
+        products = await fetch_page(response, query, limit, cursor, sort, user_email=user_email)
         
         print(f"Found {len(products)} products")  # Debug log
         
         return products
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Search error: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
 @app.get("/product/advanced-search")
 async def advanced_search_products(
+    response: Response,
     title: Optional[str] = None,
     category: Optional[str] = None,
     brand: Optional[str] = None,
@@ -269,89 +353,213 @@ async def advanced_search_products(
     condition: Optional[str] = None,
     min_price: Optional[float] = None,
     max_price: Optional[float] = None,
-    owner_id: Optional[str] = None
+    owner_id: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_email: Optional[str] = None
 ):
     """Advanced search with multiple filter options"""
     try:
-        query = {}
-        
-        # Handle title search with case-insensitive regex
-        if title and title.strip():
-            query["title"] = {"$regex": title.strip(), "$options": "i"}
-        
-        # Handle category search (case-insensitive)
-        if category and category.strip() and category.lower() != "all":
-            query["category"] = {"$regex": f"^{category.strip()}$", "$options": "i"}
-        
-        # Handle brand search (case-insensitive)
-        if brand and brand.strip() and brand.lower() != "all":
-            query["brand"] = {"$regex": f"^{brand.strip()}$", "$options": "i"}
-        
-        # Handle color search (case-insensitive)
-        if color and color.strip() and color.lower() != "all":
-            query["color"] = {"$regex": f"^{color.strip()}$", "$options": "i"}
-        
-        # Handle size search (exact match)
-        if size and size.strip() and size.lower() != "all":
-            query["size"] = size.strip()
-        
-        # Handle condition search (exact match)
-        if condition and condition.strip() and condition.lower() != "all":
-            query["condition"] = condition.strip()
-        
-        # Handle owner search
-        if owner_id and owner_id.strip():
-            query["owner_id"] = owner_id.strip()
-        
-        # Handle price range
-        if min_price is not None or max_price is not None:
-            query["price"] = {}
-            if min_price is not None and min_price > 0:
-                query["price"]["$gte"] = float(min_price)
-            if max_price is not None and max_price > 0:
-                query["price"]["$lte"] = float(max_price)
-            
-            # Remove empty price object
-            if not query["price"]:
-                del query["price"]
-        
+        query = build_filter(
+            title=title, category=category, brand=brand, color=color, size=size,
+            condition=condition, min_price=min_price, max_price=max_price, owner_id=owner_id
+        )
         print(f"Advanced search query: {query}")  # Debug log
         
         # Execute the query
-        products_cursor = db1.get_collection('Product').find(query)
-        products = []
-        
-        for product in products_cursor:
-            # Convert ObjectId to string for JSON serialization
-            if "_id" in product:
-                product["_id"] = str(product["_id"])
-            products.append(product)
+        products = await fetch_page(response, query, limit, cursor, sort, user_email=user_email)
         
         print(f"Found {len(products)} products")  # Debug log
         
         return products
         
+    except HTTPException as e:
+        raise e
     except Exception as e:
         print(f"Advanced search error: {str(e)}")  # Debug log
         raise HTTPException(status_code=500, detail=f"Advanced search failed: {str(e)}")
 
+@app.get("/product/facets")
+async def get_product_facets(
+    title: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    condition: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    owner_id: Optional[str] = None
+):
+    """Per value counts of each facet for the advanced search filters"""
+    try:
+        query = build_filter(
+            title=title, category=category, brand=brand, color=color, size=size,
+            condition=condition, min_price=min_price, max_price=max_price, owner_id=owner_id
+        )
+        cache_key = json.dumps(query, sort_keys=True)
+        facets = facet_cache.get(cache_key)
+        if facets is None:
+            result = await products_repo.aggregate_one(facet_pipeline(query)) or {}
+            facets = {
+                field: [{"value": bucket["_id"], "count": bucket["count"]}
+                        for bucket in result.get(field, []) if bucket["_id"] is not None]
+                for field in FACET_FIELDS
+            }
+            facet_cache.set(cache_key, facets)
+        return facets
+    except Exception as e:
+        print(f"Facets error: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Failed to fetch facets: {str(e)}")
+
+@app.get("/product/export")
+async def export_products(
+    updated_since: Optional[datetime] = None,
+    resume_token: Optional[str] = None,
+    batch_size: int = Query(500, ge=1, le=5000)
+):
+    """Stream the catalog as NDJSON in (updated_at, _id) order.
+
+    After every batch a {"resume_token": ...} line is written; passing it back
+    continues the export right after the last product sent.
+    """
+    query = {"updated_at": {"$gte": updated_since}} if updated_since else {}
+    query = apply_cursor(query, resume_token, "updated")
+
+    async def lines():
+        sent = 0
+        last = None
+        async for product in products_repo.iterate(query, sort_spec("updated"), batch_size):
+            yield json.dumps(jsonable_encoder(product)) + "\n"
+            sent += 1
+            last = product
+            if sent % batch_size == 0:
+                yield json.dumps({"resume_token": next_cursor([last], True, "updated")}) + "\n"
+        if last is not None and sent % batch_size:
+            yield json.dumps({"resume_token": next_cursor([last], True, "updated")}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.get("/product/counters/stats")
+async def counter_stats():
+    """Buffered increments and flush counters of the view/like buffer"""
+    return counter_buffer.stats()
+
+@app.get("/product/{product_id}")
+async def get_product(product_id: str):
+    try:
+        product = await products_repo.get(product_id)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        known_products.set(product_id, True)
+        # Views and likes not yet flushed; counts never go below zero once written
+        for field, amount in counter_buffer.pending(product_id).items():
+            product[field] = max(0, (product.get(field) or 0) + amount)
+        return product
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Get product error: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Failed to fetch product: {str(e)}")
+
+async def require_product(product_id: str):
+    """Raise 404 unless the product exists, checking the database only on a known_products miss"""
+    if known_products.get(product_id):
+        return
+    if not await products_repo.find_one({"_id": product_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Product not found")
+    known_products.set(product_id, True)
+
+@app.post("/product/{product_id}/view")
+async def record_view(product_id: str):
+    """Count a view; buffered and written in batches, so counts are eventually consistent"""
+    await require_product(product_id)
+    counter_buffer.incr(product_id, "views")
+    return {"message": "View recorded", "product_id": product_id}
+
+@app.post("/product/{product_id}/like")
+async def like_product(product_id: str):
+    """Count a like; buffered and written in batches"""
+    await require_product(product_id)
+    counter_buffer.incr(product_id, "likes")
+    return {"message": "Like recorded", "product_id": product_id}
+
+@app.delete("/product/{product_id}/like")
+async def unlike_product(product_id: str):
+    """Take back a like; buffered and written in batches"""
+    await require_product(product_id)
+    counter_buffer.incr(product_id, "likes", -1)
+    return {"message": "Like removed", "product_id": product_id}
+
+@app.put("/product/{product_id}")
+async def update_product(product_id: str, product: Product):
+    try:
+        product_data = product.dict()
+        # Counters only change through their own endpoints, so a stale copy cannot overwrite them
+        for field in COUNTER_FIELDS:
+            product_data.pop(field, None)
+        product_data["_id"] = product_id
+        product_data["id"] = product_id
+        result = await products_repo.update(product_id, {
+            **product_data,
+            "search": build_search_fields(product_data),
+            "updated_at": datetime.now(timezone.utc)
+        })
+        facet_cache.clear()
+        return JSONResponse(status_code=200, content={"message": "Product updated successfully", "product_id": product_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/product/{product_id}")
+async def delete_product(product_id: str):
+    try:
+        deleted = await products_repo.delete(product_id, {"owner_id": 1, "images": 1})
+        facet_cache.clear()
+        known_products.pop(product_id)
+        if deleted:
+            if deleted.get("owner_id"):
+                await job_queue.enqueue("recount_owner_items", owner_id=deleted["owner_id"])
+            if deleted.get("images") and IMAGE_SERVICE_URL:
+                await job_queue.enqueue("delete_product_images", urls=deleted["images"])
+        return JSONResponse(status_code=200, content={"message": "Product deleted successfully", "product_id": product_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/product/user/{user_id}")
+async def get_products_by_user(
+    user_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern=SORT_PATTERN),
+    fields: Optional[str] = None,
+    view: Optional[str] = Query(None, pattern="^(full|card)$"),
+    user_email: Optional[str] = None
+):
+    """List a user's products, a page at a time when limit or cursor is given; the next page token is sent in X-Next-Cursor"""
+    try:
+        return await fetch_page(response, {"owner_id": user_id}, limit, cursor, sort, fields, view, user_email)
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        print(f"Get products by user error: {str(e)}")  # Debug log
+        raise HTTPException(status_code=500, detail=f"Failed to fetch user products: {str(e)}")
+
 # Wishlist endpoints
 @app.post("/wishlist/add")
 async def add_to_wishlist(product_id: str, user_email: str):
     """Add a product to user's wishlist"""
     try:
         # Check if product exists
-        product = db1.get_collection('Product').find_one({"_id": product_id})
+        product = await products_repo.get(product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Check if already in wishlist
-        existing = db1.get_collection('Wishlist').find_one({
-            "user_id": user_email,
-            "product_id": product_id
-        })
-        
+        # Writes are decided by the database; the membership cache may be stale
+        existing = await wishlist_repo.get(user_email, product_id)
         if existing:
+            await wishlist_cache.invalidate(user_email)
             raise HTTPException(status_code=400, detail="Product already in wishlist")
         
         # Add to wishlist
@@ -362,7 +570,13 @@ async def add_to_wishlist(product_id: str, user_email: str):
             "added_at": datetime.now()
         }
         
-        result = db1.get_collection('Wishlist').insert_one(wishlist_item)
+        try:
+            result = await wishlist_repo.add(wishlist_item)
+        except DuplicateKeyError:
+            # Added concurrently by another request
+            await wishlist_cache.invalidate(user_email)
+            raise HTTPException(status_code=400, detail="Product already in wishlist")
+        await wishlist_cache.add(user_email, product_id)
         
         # Convert ObjectId to string for JSON serialization
         wishlist_item["_id"] = str(result.inserted_id)
@@ -380,13 +594,13 @@ async def remove_from_wishlist(product_id: str, user_email: str):
     """Remove a product from user's wishlist"""
     try:
         # Remove from wishlist
-        result = db1.get_collection('Wishlist').delete_one({
-            "user_id": user_email,
-            "product_id": product_id
-        })
+        result = await wishlist_repo.remove(user_email, product_id)
         
         if result.deleted_count == 0:
+            # The cache may still list it if another worker removed it
+            await wishlist_cache.invalidate(user_email)
             raise HTTPException(status_code=404, detail="Product not found in wishlist")
+        await wishlist_cache.remove(user_email, product_id)
         
         return {"message": "Product removed from wishlist successfully"}
         
@@ -401,36 +615,7 @@ async def get_user_wishlist(user_email: str):
     """Get user's wishlist with populated product details"""
     try:
         # Get wishlist items with product details
-        pipeline = [
-            {"$match": {"user_id": user_email}},
-            {
-                "$lookup": {
-                    "from": "Product",
-                    "localField": "product_id",
-                    "foreignField": "_id",
-                    "as": "product"
-                }
-            },
-            {"$unwind": "$product"},
-            {
-                "$project": {
-                    "id": 1,
-                    "user_id": 1,
-                    "product_id": 1,
-                    "added_at": 1,
-                    "product": 1
-                }
-            }
-        ]
-        
-        wishlist_items = list(db1.get_collection('Wishlist').aggregate(pipeline))
-        
-        # Convert ObjectIds to strings
-        for item in wishlist_items:
-            if "_id" in item:
-                item["_id"] = str(item["_id"])
-            if "product" in item and "_id" in item["product"]:
-                item["product"]["_id"] = str(item["product"]["_id"])
+        wishlist_items = await wishlist_repo.list_with_products(user_email)
         
         return wishlist_items
         
@@ -438,29 +623,43 @@ async def get_user_wishlist(user_email: str):
         print(f"Get wishlist error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get wishlist: {str(e)}")
 
+@app.post("/wishlist/check")
+async def check_wishlist_status_bulk(data: WishlistCheckRequest):
+    """Return which of the given products are in user's wishlist"""
+    try:
+        wishlisted = await wishlisted_among(data.user_email, data.product_ids)
+        return {"wishlisted": [pid for pid in data.product_ids if pid in wishlisted]}
+        
+    except Exception as e:
+        print(f"Bulk check wishlist status error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to check wishlist: {str(e)}")
+
 @app.get("/wishlist/check/{product_id}")
 async def check_wishlist_status(product_id: str, user_email: str):
     """Check if a product is in user's wishlist"""
     try:
         # Check if product is in wishlist
-        wishlist_item = db1.get_collection('Wishlist').find_one({
-            "user_id": user_email,
-            "product_id": product_id
-        })
+        wishlisted = await wishlisted_among(user_email, [product_id])
         
-        return {"in_wishlist": wishlist_item is not None}
+        return {"in_wishlist": product_id in wishlisted}
         
     except Exception as e:
         print(f"Check wishlist status error: {str(e)}")
         return {"in_wishlist": False}
 
+@app.get("/wishlist/cache/stats")
+async def wishlist_cache_stats():
+    """Hit, miss and eviction counters of the wishlist membership cache"""
+    return wishlist_cache.stats()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     try:
         # Test database connection
-        db1.command('ping')
-        return {"status": "healthy", "service": "product-service", "database": "connected"}
+        await db1.command('ping')
+        return {"status": "healthy", "service": "product-service", "database": "connected", "pool": pool_stats(),
+                "jobs": job_queue.stats()}
     except Exception as e:
         raise HTTPException(status_code=503, detail=f"Service unhealthy: {str(e)}")
 
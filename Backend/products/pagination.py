@@ -0,0 +1,139 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional
+from fastapi import HTTPException
+from schema import Product
+
+DEFAULT_PAGE_SIZE = 48
+MAX_PAGE_SIZE = 200
+
+# Fields the product grid actually renders
+CARD_FIELDS = [
+    "id", "title", "price", "originalPrice", "category", "size", "condition",
+    "brand", "status", "points", "likes", "views", "postedDate", "owner_id",
+]
+
+# Only real product fields may be projected
+PROJECTABLE_FIELDS = set(Product.model_fields) | {"_id"}
+
+# sort= values, each ordered by (field, _id) so pages are stable
+SORT_OPTIONS = {
+    "newest": ("postedDate", -1),
+    "oldest": ("postedDate", 1),
+    "price_asc": ("price", 1),
+    "price_desc": ("price", -1),
+    "popularity": ("likes", -1),
+    "likes": ("likes", -1),
+    "views": ("views", -1),
+    "updated": ("updated_at", 1),
+}
+
+# Indexes matching every sort order, including a seller's own listings
+SORT_INDEXES = [
+    ([("postedDate", -1), ("_id", -1)], {"name": "sort_newest"}),
+    ([("price", 1), ("_id", 1)], {"name": "sort_price"}),
+    ([("likes", -1), ("_id", -1)], {"name": "sort_likes"}),
+    ([("views", -1), ("_id", -1)], {"name": "sort_views"}),
+    ([("owner_id", 1), ("postedDate", -1), ("_id", -1)], {"name": "owner_newest"}),
+    ([("updated_at", 1), ("_id", 1)], {"name": "sort_updated"}),
+]
+
+
+def resolve_sort(sort: Optional[str]) -> tuple:
+    """Return the (field, direction) for a sort= value, _id order by default"""
+    if not sort:
+        return "_id", 1
+    if sort not in SORT_OPTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort. Allowed: {', '.join(SORT_OPTIONS)}")
+    return SORT_OPTIONS[sort]
+
+
+def sort_spec(sort: Optional[str]) -> list:
+    field, direction = resolve_sort(sort)
+    if field == "_id":
+        return [("_id", direction)]
+    return [(field, direction), ("_id", direction)]
+
+
+def encode_cursor(values: dict) -> str:
+    """Encode the sort key of the last item of a page as an opaque token"""
+    if isinstance(values.get("v"), datetime):
+        values = {**values, "v": {"$date": values["v"].isoformat()}}
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, dict) or "_id" not in values:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if isinstance(values.get("v"), dict):
+        try:
+            values["v"] = datetime.fromisoformat(values["v"]["$date"])
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def keyset_filter(field: str, direction: int, values: dict) -> dict:
+    """Match the items that come after the cursor position in (field, _id) order"""
+    id_op = "$gt" if direction == 1 else "$lt"
+    if field == "_id":
+        return {"_id": {id_op: values["_id"]}}
+
+    value = values.get("v")
+    ties = {field: value, "_id": {id_op: values["_id"]}}
+    if value is None:
+        # Missing values sort lowest, ascending pages continue into real values
+        return {"$or": [ties, {field: {"$ne": None}}]} if direction == 1 else ties
+    after = [{field: {"$gt" if direction == 1 else "$lt": value}}, ties]
+    if direction == -1:
+        after.append({field: None})
+    return {"$or": after}
+
+
+def apply_cursor(query: dict, cursor: Optional[str], sort: Optional[str] = None) -> dict:
+    """Restrict a query to the items after the cursor in the requested sort order"""
+    if not cursor:
+        return query
+    values = decode_cursor(cursor)
+    if values.get("s") != sort:
+        raise HTTPException(status_code=400, detail="Cursor does not match the requested sort")
+    after = keyset_filter(*resolve_sort(sort), values)
+    return {"$and": [query, after]} if query else after
+
+
+def next_cursor(items: List[dict], has_more: bool, sort: Optional[str] = None) -> Optional[str]:
+    if not has_more or not items:
+        return None
+    field, _ = resolve_sort(sort)
+    values = {"s": sort, "_id": items[-1]["_id"]}
+    if field != "_id":
+        values["v"] = items[-1].get(field)
+    return encode_cursor(values)
+
+
+def build_projection(fields: Optional[str] = None, view: Optional[str] = None, sort: Optional[str] = None) -> Optional[dict]:
+    """Build a Mongo projection from a comma separated field list or a named view"""
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in PROJECTABLE_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        projection = {f: 1 for f in requested}
+    elif view == "card":
+        projection = {f: 1 for f in CARD_FIELDS}
+        # The grid only shows the cover photo
+        projection["images"] = {"$slice": 1}
+    else:
+        return None
+    # The cursor is built from _id and the sort field
+    projection["_id"] = 1
+    projection.setdefault("id", 1)
+    projection.setdefault(resolve_sort(sort)[0], 1)
+    return projection
@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+# Internal fields that are never returned to clients
+HIDDEN_FIELDS = {"search": 0}
+
+
+def stringify_id(document: Optional[dict]) -> Optional[dict]:
+    """Convert the Mongo _id of a document to a string for JSON serialization"""
+    if document and "_id" in document:
+        document["_id"] = str(document["_id"])
+    return document
+
+
+class ProductRepository:
+    """Async data access for the Product collection"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.get_collection('Product')
+
+    async def get(self, product_id: str) -> Optional[dict]:
+        return stringify_id(await self.collection.find_one({"_id": product_id}, HIDDEN_FIELDS))
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return stringify_id(await self.collection.find_one(query, projection or HIDDEN_FIELDS))
+
+    async def find(self, query: dict, projection: Optional[dict] = None) -> List[dict]:
+        products = []
+        async for product in self.collection.find(query, projection or HIDDEN_FIELDS):
+            products.append(stringify_id(product))
+        return products
+
+    async def find_page(self, query: dict, limit: Optional[int], projection: Optional[dict] = None,
+                        sort: Optional[list] = None):
+        """Return up to `limit` products (all of them when None) in sort order (_id by default) and whether more follow"""
+        products = []
+        cursor = self.collection.find(query, projection or HIDDEN_FIELDS).sort(sort or [("_id", 1)])
+        if limit is not None:
+            cursor = cursor.limit(limit + 1)
+        async for product in cursor:
+            products.append(stringify_id(product))
+        if limit is None:
+            return products, False
+        return products[:limit], len(products) > limit
+
+    async def iterate(self, query: dict, sort: list, batch_size: int = 500):
+        """Yield products one at a time while the driver fetches them in batches"""
+        cursor = self.collection.find(query, HIDDEN_FIELDS).sort(sort).batch_size(batch_size)
+        async for product in cursor:
+            yield stringify_id(product)
+
+    async def aggregate_one(self, pipeline: list) -> Optional[dict]:
+        """Run a pipeline that produces a single document, such as a $facet stage"""
+        async for document in self.collection.aggregate(pipeline):
+            return document
+        return None
+
+    async def insert(self, product_data: dict):
+        return await self.collection.insert_one(product_data)
+
+    async def update(self, product_id: str, fields: dict):
+        return await self.collection.update_one({"_id": product_id}, {"$set": fields})
+
+    async def increment_counters(self, increments: Dict[str, Dict[str, int]]):
+        """Apply {product_id: {field: amount}} counter increments in one unordered bulk write.
+
+        Each counter is clamped at zero, so unlikes flushed ahead of their likes never leave it negative.
+        """
+        return await self.collection.bulk_write(
+            [UpdateOne({"_id": product_id}, [{"$set": {
+                field: {"$max": [0, {"$add": [{"$ifNull": [f"${field}", 0]}, amount]}]}
+                for field, amount in fields.items()
+            }}]) for product_id, fields in increments.items()],
+            ordered=False
+        )
+
+    async def delete(self, product_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """Delete a product and return the requested fields of what was deleted"""
+        return await self.collection.find_one_and_delete({"_id": product_id}, projection or {"_id": 1})
+
+
+class WishlistRepository:
+    """Async data access for the Wishlist collection"""
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db.get_collection('Wishlist')
+
+    async def get(self, user_id: str, product_id: str) -> Optional[dict]:
+        return stringify_id(await self.collection.find_one({
+            "user_id": user_id,
+            "product_id": product_id
+        }))
+
+    async def product_ids(self, user_id: str, limit: int = 0) -> set:
+        """Return the product IDs in the user's wishlist, at most `limit` when set"""
+        cursor = self.collection.find({"user_id": user_id}, {"_id": 0, "product_id": 1}).limit(limit)
+        return {item["product_id"] async for item in cursor}
+
+    async def wishlisted_ids(self, user_id: str, product_ids: List[str]) -> set:
+        """Return which of the given products are in the user's wishlist, in one query"""
+        cursor = self.collection.find(
+            {"user_id": user_id, "product_id": {"$in": product_ids}},
+            {"_id": 0, "product_id": 1}
+        )
+        return {item["product_id"] async for item in cursor}
+
+    async def add(self, wishlist_item: dict):
+        return await self.collection.insert_one(wishlist_item)
+
+    async def remove(self, user_id: str, product_id: str):
+        return await self.collection.delete_one({
+            "user_id": user_id,
+            "product_id": product_id
+        })
+
+    async def list_with_products(self, user_id: str) -> List[dict]:
+        """Return the user's wishlist items with the product document joined in"""
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {
+                "$lookup": {
+                    "from": "Product",
+                    "localField": "product_id",
+                    "foreignField": "_id",
+                    "as": "product"
+                }
+            },
+            {"$unwind": "$product"},
+            {"$unset": "product.search"},
+            {
+                "$project": {
+                    "id": 1,
+                    "user_id": 1,
+                    "product_id": 1,
+                    "added_at": 1,
+                    "product": 1
+                }
+            }
+        ]
+        wishlist_items = []
+        async for item in self.collection.aggregate(pipeline):
+            stringify_id(item)
+            if "product" in item:
+                stringify_id(item["product"])
+            wishlist_items.append(item)
+        return wishlist_items
+
@@ -45,4 +45,8 @@ class WishlistItem(BaseModel):
     user_id: str
     product_id: str
     added_at: datetime = Field(default_factory=datetime.now)
-    product: Optional[Product] = None  # For populated wishlist items
\ No newline at end of file
+    product: Optional[Product] = None  # For populated wishlist items
+
+class WishlistCheckRequest(BaseModel):
+    user_email: str
+    product_ids: List[str] = Field(..., max_length=200)
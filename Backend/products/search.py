@@ -0,0 +1,149 @@
+import re
+import unicodedata
+from typing import List, Optional
+from pymongo import UpdateOne
+
+# Facets are stored lowercased under product.search so filters are plain
+# equality predicates that can use an index instead of ^...$ regexes
+FACET_FIELDS = ["category", "brand", "color", "size", "condition"]
+
+# Keywords come from these fields; a multikey index on search.keywords serves
+# title search (whole words plus a prefix match on the last word typed)
+KEYWORD_SOURCES = ["title", "description", "brand", "color", "category"]
+
+# Equality facet first, price range second so combined filters stay on one index
+SEARCH_INDEXES = [
+    ([("search.keywords", 1)], {"name": "search_keywords"}),
+    ([("search.category", 1), ("price", 1)], {"name": "search_category_price"}),
+    ([("search.brand", 1), ("price", 1)], {"name": "search_brand_price"}),
+    ([("search.color", 1), ("price", 1)], {"name": "search_color_price"}),
+    ([("search.size", 1), ("price", 1)], {"name": "search_size_price"}),
+    ([("search.condition", 1), ("price", 1)], {"name": "search_condition_price"}),
+    ([("owner_id", 1), ("_id", 1)], {"name": "owner_id"}),
+    # Lets the startup backfill find stale search documents without a collection scan
+    ([("search.version", 1)], {"name": "search_version"}),
+]
+
+# Bumped when the way keywords are derived changes, so stored ones are rebuilt
+SEARCH_VERSION = 2
+
+# Matches nothing, for searches that cannot match any product
+NO_MATCH = {"_id": {"$in": []}}
+
+
+def normalize(value) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip().lower()
+    return value or None
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into casefolded words in any script.
+
+    Combining marks (Devanagari vowel signs, accents) stay part of their
+    word; `\w` alone would split a word like साड़ी at every one of them.
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return "".join(
+        c if c.isalnum() or unicodedata.category(c).startswith("M") else " " for c in text
+    ).split()
+
+
+def build_search_fields(product: dict) -> dict:
+    """Derive the normalized search document stored alongside a product"""
+    keywords = set()
+    for field in KEYWORD_SOURCES:
+        keywords.update(tokenize(product.get(field)))
+    for tag in product.get("tags") or []:
+        keywords.update(tokenize(tag))
+    search = {field: normalize(product.get(field)) for field in FACET_FIELDS}
+    search["keywords"] = sorted(keywords)
+    search["version"] = SEARCH_VERSION
+    return search
+
+
+def _is_set(value: Optional[str]) -> bool:
+    return bool(value and value.strip() and value.strip().lower() != "all")
+
+
+def build_filter(
+    title: Optional[str] = None,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    color: Optional[str] = None,
+    size: Optional[str] = None,
+    condition: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    owner_id: Optional[str] = None
+) -> dict:
+    """Build an index friendly Mongo filter from search parameters"""
+    query = {}
+    clauses = []
+
+    tokens = tokenize(title)
+    if title and title.strip() and not tokens:
+        # Only punctuation or symbols: no product has such a keyword
+        clauses.append(NO_MATCH)
+    elif tokens:
+        # Every word must match, the last one may still be being typed
+        *words, last = tokens
+        if words:
+            clauses.append({"search.keywords": {"$all": words}})
+        clauses.append({"search.keywords": {"$regex": f"^{re.escape(last)}"}})
+
+    facets = {"category": category, "brand": brand, "color": color, "size": size, "condition": condition}
+    for field, value in facets.items():
+        if _is_set(value):
+            query[f"search.{field}"] = normalize(value)
+
+    if owner_id and owner_id.strip():
+        query["owner_id"] = owner_id.strip()
+
+    price = {}
+    if min_price is not None and min_price > 0:
+        price["$gte"] = float(min_price)
+    if max_price is not None and max_price > 0:
+        price["$lte"] = float(max_price)
+    if price:
+        query["price"] = price
+
+    if len(clauses) == 1:
+        query.update(clauses[0])
+    elif clauses:
+        query["$and"] = clauses
+    return query
+
+
+def facet_pipeline(query: dict) -> list:
+    """Count products per facet value for the given filter in one aggregation"""
+    return [
+        {"$match": query},
+        {"$facet": {
+            field: [
+                {"$group": {"_id": f"$search.{field}", "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}}
+            ]
+            for field in FACET_FIELDS
+        }}
+    ]
+
+
+async def backfill_search_fields(collection, batch_size: int = 500):
+    """Add the search document to products written before it existed or before SEARCH_VERSION.
+
+    Runs on every start; the search_version index bounds the $ne scan to the
+    stale products (a missing version is indexed as null), so with none left
+    it only touches an empty index range.
+    """
+    requests = []
+    async for product in collection.find({"search.version": {"$ne": SEARCH_VERSION}}):
+        requests.append(UpdateOne({"_id": product["_id"]}, {"$set": {"search": build_search_fields(product)}}))
+        if len(requests) >= batch_size:
+            await collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        await collection.bulk_write(requests, ordered=False)
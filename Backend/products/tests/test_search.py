@@ -0,0 +1,85 @@
+"""Keyword tokenizing and Mongo filter building for product search"""
+import pytest
+
+from search import NO_MATCH, SEARCH_VERSION, build_filter, build_search_fields, tokenize
+
+
+def test_tokenize_casefolds_and_splits_on_punctuation():
+    assert tokenize("Blue DENIM-Jacket, size M!") == ["blue", "denim", "jacket", "size", "m"]
+
+
+def test_tokenize_keeps_non_latin_words_whole():
+    # Devanagari vowel signs and the nukta are combining marks, not separators
+    assert tokenize("लाल साड़ी") == ["लाल", "साड़ी"]
+    assert tokenize("Café Crème") == ["café", "crème"]
+
+
+def test_tokenize_normalizes_composed_and_decomposed_forms():
+    assert tokenize("Caf\u00e9") == tokenize("Cafe\u0301") == ["caf\u00e9"]
+
+
+def test_tokenize_casefolds_beyond_lower():
+    assert tokenize("STRASSE Straße") == ["strasse", "strasse"]
+
+
+@pytest.mark.parametrize("text", [None, "", "   ", "!!! ..."])
+def test_tokenize_without_words(text):
+    assert tokenize(text) == []
+
+
+def test_build_search_fields():
+    search = build_search_fields({
+        "title": "Red Wool Scarf", "description": "Warm", "brand": "Zara", "color": "Red",
+        "category": "Accessories", "size": "M", "tags": ["winter"]
+    })
+    assert search["keywords"] == ["accessories", "red", "scarf", "warm", "winter", "wool", "zara"]
+    assert search["brand"] == "zara"
+    assert search["size"] == "m"
+    assert search["condition"] is None
+    assert search["version"] == SEARCH_VERSION
+
+
+def test_build_filter_without_parameters_matches_everything():
+    assert build_filter() == {}
+    assert build_filter(title="  ", category="all") == {}
+
+
+def test_build_filter_single_word_is_a_prefix_match():
+    assert build_filter(title="Jack") == {"search.keywords": {"$regex": "^jack"}}
+
+
+def test_build_filter_needs_every_word_and_prefix_of_the_last():
+    assert build_filter(title="blue denim jack") == {"$and": [
+        {"search.keywords": {"$all": ["blue", "denim"]}},
+        {"search.keywords": {"$regex": "^jack"}},
+    ]}
+
+
+def test_build_filter_non_latin_title_filters():
+    assert build_filter(title="साड़ी") == {"search.keywords": {"$regex": "^साड़ी"}}
+
+
+def test_build_filter_title_without_words_matches_nothing():
+    assert build_filter(title="!!!") == NO_MATCH
+    assert build_filter(title="?", category="tops") == {**NO_MATCH, "search.category": "tops"}
+
+
+def test_build_filter_escapes_regex_characters():
+    # Tokens never contain regex syntax, but the prefix is escaped regardless
+    assert build_filter(title="c++")["search.keywords"] == {"$regex": "^c"}
+
+
+def test_build_filter_facets_owner_and_price():
+    assert build_filter(
+        category=" Outerwear ", brand="All", color="Blue", owner_id=" seller@example.com ",
+        min_price=10, max_price=0
+    ) == {
+        "search.category": "outerwear",
+        "search.color": "blue",
+        "owner_id": "seller@example.com",
+        "price": {"$gte": 10.0},
+    }
+
+
+def test_build_filter_price_range():
+    assert build_filter(min_price=5, max_price=50)["price"] == {"$gte": 5.0, "$lte": 50.0}
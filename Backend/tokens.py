@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from jwt import JWT, jwk_from_dict
+
+from caches import TokenMemo
+
+
+class TokenCodec:
+    """Signs and verifies session tokens, shared by the auth and product services.
+
+    The JWT instance and key are built once, and verified payloads are kept in
+    a bounded LRU keyed by the token's SHA-256 digest until the token expires,
+    so repeat requests with the same cookie skip signature verification.
+    """
+
+    def __init__(self, secret: str, algorithm: Optional[str] = None, cache_size: int = 4096):
+        self.secret = secret
+        self.algorithm = algorithm or "HS256"
+        self.cache_size = cache_size
+        self._jwt = JWT()
+        self._key = None
+        self._cache = TokenMemo(cache_size)
+
+    @property
+    def key(self):
+        if self._key is None:
+            self._key = jwk_from_dict({
+                "k": self.secret,
+                "kty": "oct"
+            })
+        return self._key
+
+    def encode(self, claims: dict, expires_delta: Optional[timedelta] = None) -> str:
+        now = datetime.now(timezone.utc)
+        expire = now + (expires_delta or timedelta(hours=1))
+        to_encode = dict(claims)
+        to_encode.update({
+            "exp": int(expire.timestamp()),
+            "iat": int(now.timestamp())
+        })
+        return self._jwt.encode(to_encode, self.key, alg=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        """Verify a token and return its payload, raising JWTDecodeError when invalid or expired"""
+        cached = self._cache.get(token)
+        if cached is not None:
+            return cached
+
+        # Signature, exp and nbf are checked by the library
+        payload = self._jwt.decode(token, self.key, algorithms={self.algorithm})
+
+        exp = payload.get("exp")
+        if exp:
+            self._cache.set(token, payload, exp)
+        return dict(payload)
+
+    def clear(self):
+        self._cache.clear()
+
+
+def session_claims(user: dict) -> dict:
+    """Compact claims for a session token, the profile itself is looked up server side"""
+    return {
+        "sub": str(user["_id"]),
+        "email": user["email"],
+        "role": user.get("role") or "user",
+        "ver": user.get("token_version", 0)
+    }
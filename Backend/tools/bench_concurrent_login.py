@@ -0,0 +1,69 @@
+"""
+Concurrent login benchmark for password verification.
+
+Runs N concurrent bcrypt verifications the old way (inline on the event loop)
+and through the auth service's PasswordHasher pool, and reports wall time,
+logins/sec and the worst event loop stall seen by a 10 ms heartbeat, which is
+what every other request on the worker experiences during a login burst.
+
+    python tools/bench_concurrent_login.py --logins 64 --rounds 12 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from passlib.context import CryptContext
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "auth"))
+from passwords import PasswordHasher  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    interval = 0.01
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(label: str, verify, hashed: str, logins: int):
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(verify(PASSWORD, hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await beat
+    assert all(results)
+    print(f"{label:<22} {elapsed:>8.2f} s {logins / elapsed:>10.1f} logins/s {max(lags or [0]) * 1000:>10.1f} ms max loop stall")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    args = parser.parse_args()
+
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__default_rounds=args.rounds)
+    hashed = context.hash(PASSWORD)
+
+    async def inline_verify(plain, stored):
+        return context.verify(plain, stored)
+
+    hasher = PasswordHasher(rounds=args.rounds, max_workers=args.workers, max_pending=args.logins)
+    await run("inline on event loop", inline_verify, hashed, args.logins)
+    await run(f"pool ({args.workers} workers)", hasher.verify, hashed, args.logins)
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Multi-image upload benchmark for the image service.
+
+Uploads a listing's worth of images to the in-memory stub backend (which
+sleeps to stand in for network latency) the old way, one after another,
+and through the image service's UploadPool, and reports wall time per
+listing and the worst event loop stall seen by a 10 ms heartbeat.
+
+    python tools/bench_image_upload.py --images 6 --latency 0.4 --workers 6
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images"))
+from storage import StubBackend  # noqa: E402
+from uploads import UploadPool  # noqa: E402
+
+
+async def heartbeat(stop: asyncio.Event, lags: list):
+    interval = 0.01
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(label: str, upload, images: list):
+    stop = asyncio.Event()
+    lags = []
+    beat = asyncio.create_task(heartbeat(stop, lags))
+    await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    results = await upload(images)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await beat
+    assert len(results) == len(images) and not any(isinstance(r, BaseException) for r in results)
+    print(f"{label:<22} {elapsed:>8.2f} s {max(lags or [0]) * 1000:>10.1f} ms max loop stall")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=6)
+    parser.add_argument("--size", type=int, default=2 * 1024 * 1024, help="bytes per image")
+    parser.add_argument("--latency", type=float, default=0.4, help="seconds per stub upload")
+    parser.add_argument("--workers", type=int, default=6)
+    args = parser.parse_args()
+
+    backend = StubBackend(latency=args.latency)
+    images = [(os.urandom(args.size), "jpeg") for _ in range(args.images)]
+
+    async def sequential(batch):
+        # What upload_image used to do: blocking uploads inline on the event loop
+        return [backend.upload(contents, "bench", format) for contents, format in batch]
+
+    pool = UploadPool(backend, max_workers=args.workers)
+    await run("sequential inline", sequential, images)
+    await run(f"pool ({args.workers} workers)", lambda batch: pool.upload_many(batch, "bench"), images)
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,161 @@
+"""
+Concurrent load benchmark for the product service.
+
+Seeds a local mongod with synthetic listings, then fires concurrent catalog
+requests at one or more running product services and prints throughput and
+latency percentiles for each, so a sync (pymongo) build and an async (Motor)
+build can be compared side by side:
+
+    # terminal 1: baseline checkout, terminal 2: current checkout
+    uvicorn main:app --port 8002
+    uvicorn main:app --port 8012
+
+    python tools/bench_product_load.py --seed 5000 \\
+        --target before=http://localhost:8002 --target after=http://localhost:8012
+
+Both services must point Database_Link at the same mongod as --mongo, and
+Database_Name (default SSRealEstate) at the same database as this script.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from uuid import uuid4
+
+import httpx
+from pymongo import MongoClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "products"))
+from database import DATABASE_NAME  # noqa: E402
+from search import build_search_fields  # noqa: E402
+
+CATEGORIES = ["tops", "bottoms", "dresses", "outerwear", "shoes", "accessories"]
+BRANDS = ["zara", "h&m", "levis", "nike", "uniqlo", "mango"]
+COLORS = ["black", "white", "blue", "red", "green", "beige"]
+SIZES = ["XS", "S", "M", "L", "XL"]
+CONDITIONS = ["new", "like new", "good", "fair"]
+
+
+def seed_products(mongo_uri: str, count: int):
+    """Replace the Product collection with `count` synthetic listings.
+
+    Listings carry the search document the current build filters on; a
+    baseline build ignores it and matches on the plain fields, so both
+    answer the same searches with the same rows.
+    """
+    collection = MongoClient(mongo_uri)[DATABASE_NAME].get_collection('Product')
+    collection.delete_many({})
+    batch = []
+    for i in range(count):
+        product_id = str(uuid4())
+        product = {
+            "_id": product_id,
+            "id": product_id,
+            "title": f"{random.choice(COLORS)} {random.choice(CATEGORIES)} {i}",
+            "description": "Gently used, washed and ready for a new home. " * 4,
+            "price": round(random.uniform(5, 250), 2),
+            "category": random.choice(CATEGORIES),
+            "brand": random.choice(BRANDS),
+            "color": random.choice(COLORS),
+            "size": random.choice(SIZES),
+            "condition": random.choice(CONDITIONS),
+            "owner_id": f"user{i % 200}@example.com",
+            "images": [f"https://example.com/{product_id}/{n}.jpg" for n in range(4)],
+            "likes": random.randint(0, 500),
+            "views": random.randint(0, 5000),
+            "status": "available",
+        }
+        product["search"] = build_search_fields(product)
+        batch.append(product)
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    return [doc["_id"] for doc in collection.find({}, {"_id": 1}).limit(500)]
+
+
+def request_mix(product_ids):
+    """Yield an endless mix of catalog requests resembling browse traffic"""
+    while True:
+        roll = random.random()
+        if roll < 0.4:
+            yield f"/product/{random.choice(product_ids)}"
+        elif roll < 0.7:
+            yield f"/product/user/user{random.randint(0, 199)}@example.com"
+        elif roll < 0.9:
+            yield f"/product/advanced-search?category={random.choice(CATEGORIES)}&brand={random.choice(BRANDS)}"
+        else:
+            yield "/health"
+
+
+async def run_target(base_url: str, paths, total: int, concurrency: int):
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                path = next(paths)
+                started = time.perf_counter()
+                try:
+                    response = await client.get(path)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", action="append", required=True,
+                        help="label=url of a running product service, may be repeated")
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--seed", type=int, default=0, help="number of products to seed (0 keeps existing data)")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.seed:
+        product_ids = seed_products(args.mongo, args.seed)
+    else:
+        collection = MongoClient(args.mongo)[DATABASE_NAME].get_collection('Product')
+        product_ids = [doc["_id"] for doc in collection.find({}, {"_id": 1}).limit(500)]
+    if not product_ids:
+        raise SystemExit("No products to benchmark against, pass --seed N")
+
+    print(f"{'target':<10} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for target in args.target:
+        label, _, url = target.partition("=")
+        paths = request_mix(product_ids)
+        # Warm up connection pools before measuring
+        await run_target(url, paths, min(200, args.requests), min(20, args.concurrency))
+        result = await run_target(url, paths, args.requests, args.concurrency)
+        print(f"{label:<10} {result['requests']:>9} {result['errors']:>7} {result['rps']:>9.1f} "
+              f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
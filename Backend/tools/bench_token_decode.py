@@ -0,0 +1,68 @@
+"""
+Micro-benchmark of session token decoding.
+
+Compares the old per-request path (new JWT() and jwk_from_dict on every call,
+then a manual exp check) with the shared TokenCodec, both with its verified
+token cache disabled and warm.
+
+    python tools/bench_token_decode.py --iterations 20000
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from jwt import JWT, jwk_from_dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tokens import TokenCodec  # noqa: E402
+
+SECRET = base64.urlsafe_b64encode(b"benchmark-secret-key-0123456789").decode().rstrip("=")
+CLAIMS = {"email": "bench@example.com", "role": "user", "name": "Bench User"}
+
+
+def legacy_decode(token: str) -> dict:
+    jwt_instance = JWT()
+    secret_key = jwk_from_dict({
+        "k": SECRET,
+        "kty": "oct"
+    })
+    current_time = datetime.now(timezone.utc)
+    payload = jwt_instance.decode(token, secret_key, algorithms={"HS256"})
+    exp = payload.get('exp')
+    if exp and current_time > datetime.fromtimestamp(exp, timezone.utc):
+        raise ValueError("Token has expired")
+    return {"email": payload["email"], "role": payload["role"]}
+
+
+def measure(label: str, decode, tokens, iterations: int):
+    started = time.perf_counter()
+    for i in range(iterations):
+        decode(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} {iterations / elapsed:>12,.0f} ops/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=500, help="distinct tokens in rotation")
+    args = parser.parse_args()
+
+    signer = TokenCodec(SECRET, "HS256")
+    tokens = [signer.encode({**CLAIMS, "sid": i}, timedelta(hours=1)) for i in range(args.sessions)]
+
+    uncached = TokenCodec(SECRET, "HS256", cache_size=0)
+    cached = TokenCodec(SECRET, "HS256", cache_size=args.sessions)
+    for token in tokens:
+        cached.decode(token)
+
+    measure("legacy (per-request key)", legacy_decode, tokens, args.iterations)
+    measure("TokenCodec, cache off", uncached.decode, tokens, args.iterations)
+    measure("TokenCodec, cache warm", cached.decode, tokens, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Check that hot queries and product search filters are answered from an index.
+
+Bootstraps the services' indexes in a scratch database on a local mongod,
+then runs explain() on the hot User, Product and Wishlist lookups and on
+every combination of search filters built by the product service's query
+builder, and fails if any winning plan lacks an IXSCAN or falls back to a
+COLLSCAN. Every sort= order is also checked to be served by an index rather
+than an in-memory SORT stage.
+
+    python tools/check_query_plans.py --mongo mongodb://localhost:27017
+"""
+import argparse
+import itertools
+import os
+import sys
+
+from pymongo import MongoClient
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "products"))
+from indexes import PRODUCT_INDEXES, USER_INDEXES, WISHLIST_INDEXES, bootstrap  # noqa: E402
+from search import SEARCH_INDEXES, build_filter, build_search_fields  # noqa: E402
+from pagination import SORT_INDEXES, SORT_OPTIONS, sort_spec  # noqa: E402
+
+FILTER_VALUES = {
+    "title": "blue denim jack",
+    "category": "Outerwear",
+    "brand": "Levis",
+    "color": "Blue",
+    "size": "M",
+    "condition": "Good",
+    "owner_id": "seller@example.com",
+    "min_price": 10,
+    "max_price": 90,
+}
+
+
+def plan_stages(plan: dict):
+    """Yield every stage name in an explain() winning plan tree"""
+    yield plan.get("stage")
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+# (collection, description, query) for lookups made on nearly every request
+HOT_QUERIES = [
+    ("User", "login / profile by email", {"email": "user1@example.com"}),
+    ("User", "Google sign-in by google_id", {"google_id": "g1"}),
+    ("Product", "duplicate listing check", {"title": "blue denim jacket 1", "category": "outerwear"}),
+    ("Product", "listings by owner", {"owner_id": "seller1@example.com"}),
+    ("Wishlist", "wishlist membership", {"user_id": "user1@example.com", "product_id": "p1"}),
+    ("Wishlist", "wishlist of a user", {"user_id": "user1@example.com"}),
+    ("Wishlist", "bulk wishlist check", {"user_id": "user1@example.com", "product_id": {"$in": ["p1", "p2"]}}),
+]
+
+# Sort orders that also have an index for a single seller's listings
+OWNER_SORTS = ["newest", "oldest"]
+
+
+def seed(db):
+    for name in ("User", "Product", "Wishlist"):
+        db.drop_collection(name)
+    bootstrap(db, {
+        "User": USER_INDEXES,
+        "Product": PRODUCT_INDEXES + SEARCH_INDEXES + SORT_INDEXES,
+        "Wishlist": WISHLIST_INDEXES,
+    })
+    db.User.insert_many([
+        {"email": f"user{i}@example.com", "google_id": f"g{i}" if i % 2 else None} for i in range(50)
+    ])
+    db.Wishlist.insert_many([
+        {"user_id": f"user{i % 50}@example.com", "product_id": f"p{i}"} for i in range(200)
+    ])
+    products = []
+    for i in range(200):
+        product = {
+            "_id": f"p{i}",
+            "title": f"blue denim jacket {i}" if i % 2 else f"red wool scarf {i}",
+            "category": "outerwear" if i % 2 else "accessories",
+            "brand": "levis" if i % 3 else "zara",
+            "color": "blue" if i % 2 else "red",
+            "size": ["S", "M", "L"][i % 3],
+            "condition": "good",
+            "owner_id": f"seller{i % 10}@example.com",
+            "price": float(i),
+        }
+        product["search"] = build_search_fields(product)
+        products.append(product)
+    db.Product.insert_many(products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="rewear_plan_check")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo)
+    db = client[args.database]
+    seed(db)
+    collection = db.get_collection("Product")
+
+    failures = 0
+    for collection_name, description, query in HOT_QUERIES:
+        plan = db.get_collection(collection_name).find(query).explain()["queryPlanner"]["winningPlan"]
+        stages = set(plan_stages(plan))
+        if "IXSCAN" not in stages or "COLLSCAN" in stages:
+            failures += 1
+            print(f"FAIL {collection_name} {description}: {sorted(s for s in stages if s)}")
+
+    names = list(FILTER_VALUES)
+    for size in range(1, len(names) + 1):
+        for combo in itertools.combinations(names, size):
+            query = build_filter(**{name: FILTER_VALUES[name] for name in combo})
+            plan = collection.find(query).explain()["queryPlanner"]["winningPlan"]
+            stages = set(plan_stages(plan))
+            if "IXSCAN" not in stages or "COLLSCAN" in stages:
+                failures += 1
+                print(f"FAIL {'+'.join(combo)}: {sorted(s for s in stages if s)}")
+
+    for name in SORT_OPTIONS:
+        checks = [("all", {})]
+        if name in OWNER_SORTS:
+            checks.append(("owner", {"owner_id": "seller1@example.com"}))
+        for label, query in checks:
+            plan = collection.find(query).sort(sort_spec(name)).limit(48).explain()["queryPlanner"]["winningPlan"]
+            stages = set(plan_stages(plan))
+            if "SORT" in stages or "COLLSCAN" in stages:
+                failures += 1
+                print(f"FAIL sort={name} ({label}): {sorted(s for s in stages if s)}")
+
+    client.drop_database(args.database)
+    if failures:
+        raise SystemExit(f"{failures} query plans are not index backed")
+    print("All hot queries, filter combinations and sort orders use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -193,10 +193,11 @@ class ApiService {
     });
   }
 
-  async forgotPassword(email: string, password: string): Promise<ApiResponse> {
+  // resetToken is returned by /verifyotp once the emailed code checks out
+  async forgotPassword(email: string, password: string, resetToken: string): Promise<ApiResponse> {
     return this.request<ApiResponse>('/user/password-reset', {
       method: 'PUT',
-      body: JSON.stringify({ email, password }),
+      body: JSON.stringify({ email, password, reset_token: resetToken }),
     });
   }
 